@@ -1,10 +1,12 @@
 #! /usr/bin/python3
 
-from datetime import datetime as dt
-from json     import dumps , load
-from os.path  import isfile, split
-from random   import SystemRandom
-from time     import sleep
+from sys import argv
+
+if __name__ == '__main__' and argv[1:2] in (['roll'], ['serve']):
+    from polyrolly.cli import main
+    raise SystemExit(main(argv[1:]))
+
+from os.path  import isfile, split, splitext
 from tkinter  import (
            BooleanVar,
            Button    ,
@@ -16,23 +18,85 @@ from tkinter  import (
            Menu      ,
            Menubutton,
            PhotoImage,
+           Scrollbar ,
            Spinbox   ,
            StringVar ,
-           Tk        )
-from tkinter.messagebox import askyesno
+           Tk        ,
+           Toplevel  )
+from collections        import deque
+from contextlib         import contextmanager
+from tkinter.messagebox import askyesno, showerror, showinfo
+from tkinter.simpledialog import askinteger, askstring
 from tkinter.filedialog import askopenfilename, asksaveasfilename
-from urllib .request    import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from shutil             import rmtree
+from tempfile           import mkdtemp
+from threading          import Event, Lock
+
+from polyrolly import container, engine, expression, journal, odds, rng, simulate, store
+from polyrolly.macro import Macro, model_rolls
+from polyrolly.archive import archive_dir
+from polyrolly.autosave import SaveScheduler
+from polyrolly.history import format_hour, format_stamp, now
+from polyrolly.stats import RunningStats
+from polyrolly.store import GroupStore
+from polyrolly.entropy import RandomOrgClient
 
 
 _title        = 'Poly Rolly v2.1  -  mznlab.net'
 roller_groups = []
-CRIT          = 1000
-FAIL          = .001
-
-def maintain_group_indices():
-    for group in roller_groups:
-        group.index = roller_groups.index(group)
-        group.grid(row=group.index)
+images        = {}
+visible_rows  = 40
+roller_fields = ('name', 'dice_qty', 'die_faces', 'modifier', 'finalmod', 'expression')
+file_types    = [('JSON', '*.json'), ('Poly Rolly', '*' + container.EXTENSION), ('All', '*.*')]
+roll_pool     = ThreadPoolExecutor(max_workers=16, thread_name_prefix='roller')
+entropy_pool  = rng.get('random.org')
+random_org    = RandomOrgClient()
+
+def draw_dice(rolls, sides, source=None):
+    if not sides:
+        return engine.draw_expression(rolls, source)
+    return engine.draw(rolls, sides, source)
+
+def draw_group(params):
+    try:
+        return random_org.draw_group(params)
+    except Exception:
+        print('Failed to use random.org, falling back to CSPRNG!')
+        return [draw_dice(rolls, sides) for rolls, sides in params]
+
+image_data = {
+    'expand'  : b'R0lGODlhEAAQAIABAAAAAP///yH5BAEKAAEALAAAAAAQABAAAAIlhI+pq+EPHYo0TGjifRkfDYAdI33WUnZc6KmlyK5wNdMrg+dJAQA7',
+    'collapse': b'R0lGODlhEAAQAIABAAAAAP///yH5BAEKAAEALAAAAAAQABAAAAIfhI+pq+EPHYo0zAovlme/y3CGmJCeeWqbirEVA8dLAQA7'        ,
+    'roll'    : b'R0lGODlhDgARAIABAAAAAP///yH5BAEKAAEALAAAAAAOABEAAAIkjB+Ai6C83GOy0iqjM7ltPoFhKEKeKZJadynfVa6HlbAp3ZIFADs=',
+    'left'    : b'R0lGODlhBwANAIABAAAAAP///yH5BAEKAAEALAAAAAAHAA0AAAITjA9nkMj+Apty2lvt0jt2VYFSAQA7'                        ,
+    'right'   : b'R0lGODlhBwANAIABAAAAAP///yH5BAEKAAEALAAAAAAHAA0AAAITRI5gGLrnXlzT1NsidEkx/zFHAQA7'                        ,
+    'up'      : b'R0lGODlhCQAFAIABAAAAAP///yH5BAEKAAEALAAAAAAJAAUAAAILjAOnwIrcDJxvwgIAOw=='                                ,
+    'down'    : b'R0lGODlhCQAFAIABAAAAAP///yH5BAEKAAEALAAAAAAJAAUAAAIKhH+BGYoNGWxgFgA7'                                    }
+
+def image(name):
+    if name not in images:
+        images[name] = PhotoImage(data=image_data[name])
+    return images[name]
+
+def reindex(items, start=0, stop=None):
+    for i, item in enumerate(items[start:stop], start):
+        if item.index != i:
+            item.index = i
+            item.regrid()
+
+def restack(items, i, widget=lambda item: item):
+    if i > 0:
+        widget(items[i]).lift(widget(items[i - 1]))
+    elif len(items) > 1:
+        widget(items[i]).lower(widget(items[1]))
+
+def maintain_group_indices(start=0, stop=None):
+    reindex(roller_groups, start, stop)
+
+def restack_group(i):
+    restack(roller_groups, i)
+    restack(roller_groups, i, lambda group: group.control_frame)
 
 def maintain_tabstops():
     for group in roller_groups:
@@ -43,14 +107,18 @@ def maintain_tabstops():
 
 class MainFrame(Frame):
     def set_saved_title(self, fpath):
-        fname = split(fpath)[-1].replace('.json', '')
+        self.dirty = False
+        fname = splitext(split(fpath)[-1])[0]
         self.master.title('{}  -  {}'.format(fname, _title))
 
     def set_unsaved_title(self, *args):
+        if self.updating:
+            self.dirty = True
+            return
         if len(roller_groups) < 1:
             return
         if self.autosave.get():
-            self.save_config(self.fpath)
+            self.autosave_config()
             return
         title = self.master.title()
         if title == _title:
@@ -63,34 +131,52 @@ class MainFrame(Frame):
     def __init__(self, master):
         Frame.__init__(self, master)
 
-        self.master = master
+        self.master    = master
+        self.rolling   = False
+        self.journal   = None
+        self.updating  = 0
+        self.dirty     = False
+        self.scratch   = None
+        self.macro     = None
+        self.replaying = False
+        self.saver     = SaveScheduler(self.after, self.after_cancel)
 
         self.use_random_org = BooleanVar()
+        self.prefetch       = BooleanVar()
+        self.seeded         = BooleanVar()
         self.allow_odd      = IntVar()
         self.always_on_top  = BooleanVar()
         self.autosave       = BooleanVar()
+        self.recording      = BooleanVar()
 
-        self.use_random_org.trace('w', self.set_unsaved_title)
-        self.allow_odd     .trace('w', self.set_unsaved_title)
-        self.always_on_top .trace('w', self.set_unsaved_title)
+        self.use_random_org.trace('w', lambda *args: self.setting_changed('use_random_org'))
+        self.prefetch      .trace('w', lambda *args: self.setting_changed('prefetch'      ))
+        self.allow_odd     .trace('w', lambda *args: self.setting_changed('allow_odd'     ))
+        self.always_on_top .trace('w', lambda *args: self.setting_changed('always_on_top' ))
 
         self.set_defaults()
 
         self.menubar = Menu(master)
 
-        self.filemenu = Menu(self.menubar, tearoff=0, postcommand=maintain_group_indices)
+        self.filemenu = Menu(self.menubar, tearoff=0)
         self.filemenu.add_command(label='New'       , underline=0, command=        self.reset_default_group          , accelerator='Ctrl+N'      )
         self.filemenu.add_command(label='Load'      , underline=3, command=        self.load_config                  , accelerator='Ctrl+D'      )
         self.filemenu.add_command(label='Save'      , underline=1, command=lambda: self.save_config(fpath=self.fpath), accelerator='Ctrl+S'      )
         self.filemenu.add_command(label='Save as...', underline=4, command=        self.save_config                  , accelerator='Ctrl+Shift+S')
 
         self.editmenu = Menu(self.menubar, tearoff=0)
-        self.editmenu.add_checkbutton(label='Use random.org'    , underline=0 , variable=self.use_random_org                                                 )
+        self.editmenu.add_checkbutton(label='Use random.org'    , underline=0 , variable=self.use_random_org , command=self.toggle_random_org                )
+        self.editmenu.add_checkbutton(label='Prefetch random.org', underline=0, variable=self.prefetch       , command=self.toggle_random_org                )
+        self.editmenu.add_checkbutton(label='Seeded rolls'      , underline=3 , variable=self.seeded         , command=self.toggle_seeded                    )
         self.editmenu.add_checkbutton(label='Allow odd dice'    , underline=6 , variable=self.allow_odd      , command=self.toggle_odd, onvalue=1, offvalue=2)
         self.editmenu.add_separator() #      ------------------
         self.editmenu.add_checkbutton(label='Always on top'     , underline=10, variable=self.always_on_top  , command=self.pin                              )
         self.editmenu.add_checkbutton(label='Autosave'          , underline=4 , variable=self.autosave       , command=self.toggle_autosave                  )
+        self.editmenu.add_command    (label='I/O stats'         , underline=0 , command=self.show_io_stats                                                   )
         self.editmenu.add_separator() #      ------------------
+        self.editmenu.add_command    (label='Simulate N rolls'  , underline=0 , command=self.simulate                                                        )
+        self.editmenu.add_checkbutton(label='Record macro'      , underline=7 , variable=self.recording      , command=self.toggle_recording                 )
+        self.editmenu.add_command    (label='Replay macro'      , underline=2 , command=self.replay_macro    , accelerator='Ctrl+Shift+R'                    )
         self.editmenu.add_command    (label='Repeat last action', underline=0 , accelerator='Ctrl+R'                                                         )
 
         self.menubar.add_cascade(label='File', underline=0, menu=self.filemenu)
@@ -106,6 +192,145 @@ class MainFrame(Frame):
         self.bind_all('<Control-d>'      , lambda e: self.load_config()                )
         self.bind_all('<Control-s>'      , lambda e: self.save_config(fpath=self.fpath))
         self.bind_all('<Control-Shift-S>', lambda e: self.save_config()                )
+        self.bind_all('<Control-Shift-R>', lambda e: self.replay_macro()               )
+
+    def setting_changed(self, key):
+        self.record('setting', k=key, v=getattr(self, key).get())
+        self.set_unsaved_title()
+
+    @contextmanager
+    def transaction(self):
+        self.updating += 1
+        try:
+            yield
+        finally:
+            self.updating -= 1
+            if not self.updating and self.dirty:
+                self.dirty = False
+                self.set_unsaved_title()
+
+    def record(self, op, **event):
+        if self.journal is not None and self.autosave.get():
+            self.journal.record(op, **event)
+
+    def repeatable(self, target, action, **options):
+        if self.replaying:
+            return
+        command = lambda: getattr(target, action)(**options)
+        self.editmenu.entryconfigure(self.editmenu.index('end'), command=command)
+        self.bind_all('<Control-r>', lambda e: command())
+        if self.recording.get():
+            self.macro.append(target, action, **options)
+
+    def toggle_recording(self):
+        if self.recording.get():
+            self.macro = Macro()
+
+    def replay_macro(self):
+        self.recording.set(False)
+        if not self.macro or self.rolling:
+            return
+        times = askinteger('Replay macro', 'Replay {} recorded actions how many times?'.format(len(self.macro)),
+                           parent=self, initialvalue=1, minvalue=1)
+        if times:
+            self.replay(self.macro, times)
+
+    def replay(self, macro, times):
+        source  = self.rng_source()
+        touched = []
+        for target, action, options in macro.steps:
+            group = target if action == 'roll_group' else getattr(target, 'group', target)
+            if group not in touched:
+                touched.append(group)
+
+        self.replaying = True
+        try:
+            with self.transaction():
+                if macro.rolls_only:
+                    steps = [self.macro_step(step, times, source) for step in macro.steps]
+                    for i in range(times):
+                        for step in steps:
+                            next(step)
+                else:
+                    for i in range(times):
+                        for step in macro.steps:
+                            next(self.macro_step(step, 1, source))
+                for group in touched:
+                    if group in roller_groups and len(group.history):
+                        group.navigate_history(desired_index=len(group.history) - 1)
+                        group.refresh_stats()
+                        for roller in group.rollers:
+                            roller.refresh_stats()
+                self.restructure()
+        finally:
+            self.replaying = False
+
+    def macro_step(self, step, n, source):
+        target, action, options = step
+        if action == 'roll_group':
+            return target.model_rolls(target.rollers + target.pending_rows(), n, source)
+        if action == 'roll':
+            return target.group.model_rolls([target], n, source)
+        return (getattr(target, action)(**options) for i in range(n))
+
+    def restructure(self):
+        if self.journal is not None:
+            self.journal.restructure()
+        self.set_unsaved_title()
+
+    def autosave_config(self):
+        self.saver.request(self.prepare_autosave)
+
+    def prepare_autosave(self):
+        if not self.autosave.get() or not self.fpath:
+            return None
+        if self.journal is None or self.journal.fpath != self.fpath or self.journal.needs_compaction():
+            return self.prepare_snapshot(self.fpath)
+        events = self.journal.take()
+        target = self.journal
+        return lambda: target.append(events)
+
+    def prepare_snapshot(self, fpath):
+        binary = container.is_container(fpath)
+        if self.journal is None or self.journal.fpath != fpath:
+            self.journal = self.open_journal(fpath)
+        self.journal.reset()
+        for group in roller_groups:
+            if group.archive is not None:
+                group.archive.relocate(archive_dir(fpath))
+        self.drop_scratch()
+        snapshot = self.snapshot_config(binary)
+        target   = self.journal
+        if binary:
+            return lambda: container.write(fpath, snapshot)
+        return lambda: target.write_snapshot(snapshot)
+
+    @staticmethod
+    def open_journal(fpath, events=0):
+        if container.is_container(fpath):
+            return journal.Journal(fpath, events, compact_every=0)
+        return journal.Journal(fpath, events)
+
+    def archive_dir(self):
+        if self.fpath:
+            return archive_dir(self.fpath)
+        if self.scratch is None:
+            self.scratch = mkdtemp(prefix='poly-rolly-')
+        return self.scratch
+
+    def drop_scratch(self):
+        if self.scratch is not None and self.fpath:
+            rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+    def close(self):
+        self.saver.flush()
+        for group in roller_groups:
+            if group.archive is not None:
+                group.archive.close()
+        if self.scratch is not None:
+            rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
 
     def ask_proceed(self):
         if '*' in self.master.title():
@@ -124,6 +349,75 @@ class MainFrame(Frame):
                 if num % 2 != 0:
                     roller.die_faces.set(num - 1)
 
+    def toggle_random_org(self):
+        if self.use_random_org.get() and self.prefetch.get():
+            entropy_pool.start()
+        else:
+            entropy_pool.close()
+
+    def toggle_seeded(self):
+        if self.seeded.get():
+            seed = askinteger('Seeded rolls', 'Seed', parent=self, initialvalue=rng.seeded.seed, minvalue=0)
+            if seed is None:
+                self.seeded.set(False)
+                return
+            rng.seeded.reseed(seed)
+        self.record_rng()
+        self.set_unsaved_title()
+
+    def record_rng(self):
+        self.record('setting', k='rng', v=rng.seeded.to_dict() if self.seeded.get() else None)
+
+    def load_rng(self, state):
+        if state:
+            rng.seeded.reseed(state['seed'], state['position'])
+        self.seeded.set(bool(state))
+
+    def rng_source(self):
+        if self.seeded.get():
+            return rng.seeded
+        if self.use_random_org.get():
+            return entropy_pool
+        return None
+
+    def simulate(self):
+        trials = askinteger('Simulate', 'Number of rolls per group', parent=self,
+                            initialvalue=100000, minvalue=1, maxvalue=10000000)
+        if not trials:
+            return
+        try:
+            from polyrolly import bulk
+        except ImportError:
+            showerror('Simulate', 'Simulations require NumPy to be installed')
+            return
+
+        configs = [group.to_config() for group in roller_groups]
+        future  = roll_pool.submit(lambda: [bulk.roll(c, trials, keep_dice=False) for c in configs])
+        future.add_done_callback(lambda f: self.after(0, lambda: self.show_simulation(trials, f)))
+
+    def show_simulation(self, trials, future):
+        try:
+            results = future.result()
+        except Exception as e:
+            showerror('Simulate', str(e))
+            return
+
+        lines = []
+        for group in results:
+            lines.append('{}  (mean total {:.2f})'.format(group.config.name, group.totals.mean()))
+            for roller in group.rollers:
+                c = roller.config
+                d = roller.summary()
+                lines.append('  {}  {}d{}{:+}{:+}:  mean {:.2f}  sd {:.2f}  {}..{}  \u25b2{:.1%}  \u25bc{:.1%}'.format(
+                    c.name, c.dice_qty, c.die_faces, c.modifier, c.finalmod,
+                    d['mean'], d['std'], d['min'], d['max'], d['crit_rate'], d['fail_rate']))
+        showinfo('{} simulated rolls'.format(trials), '\n'.join(lines), parent=self)
+
+    def show_io_stats(self):
+        lines = ['Autosave: {}'.format(self.saver.summary()),
+                 'random.org: {}'.format(random_org.summary())]
+        showinfo('I/O stats', '\n'.join(lines), parent=self)
+
     def toggle_autosave(self):
         if self.autosave.get():
             self.save_config(self.fpath)
@@ -132,14 +426,18 @@ class MainFrame(Frame):
 
     def set_defaults(self):
         self.master.title(_title)
-        self.fpath = ''
+        self.fpath   = ''
+        self.journal = None
         self.use_random_org.set(False)
+        self.prefetch      .set(True)
+        self.seeded        .set(False)
         self.allow_odd     .set(2)
         self.always_on_top .set(False)
         self.autosave      .set(False)
 
     def reset_default_group(self):
         if self.ask_proceed():
+            self.saver.flush()
             self.autosave.set(False)
             self.clear_groups()
             self.set_defaults()
@@ -148,7 +446,7 @@ class MainFrame(Frame):
     @staticmethod
     def clear_groups():
         temp_groups = list(roller_groups)
-        for group in temp_groups:
+        for group in reversed(temp_groups):
             group.remove_group(override=True)
 
     def create_group(self, index, rollers):
@@ -163,103 +461,116 @@ class MainFrame(Frame):
         if not self.ask_proceed():
             return
 
-        fpath = askopenfilename(filetypes=[('JSON', '*.json'), ('All', '*.*')], defaultextension='.json')
+        fpath = askopenfilename(filetypes=file_types, defaultextension='.json')
         if not fpath or not isfile(fpath):
             return
+        self.saver.flush()
         self.fpath = fpath
 
-        self.clear_groups()
-
-        with open(fpath, 'r') as f:
-            group_dict = load(f)
-
-        try:
-            settings_dict = group_dict.pop('settings')
-            autosave      = (settings_dict['autosave'])
-            self.use_random_org.set(settings_dict['use_random_org'])
-            self.allow_odd     .set(settings_dict['allow_odd'     ])
-            self.always_on_top .set(settings_dict['always_on_top' ])
-        except KeyError:
-            pass
-
-        g = 0
-        for group_name, group_settings in group_dict.items():
-            self.create_group(g, len(group_settings['rollers']))
-
-            group = roller_groups[g]
-            group.name.set(group_name)
-            group.index = group_settings['index']
-
-            r = 0
-            h = 0
-            for roller_name, roller_settings in group_settings['rollers'].items():
-                roller = group.rollers[r]
-                roller.name.set(roller_name)
-                for attr, value in roller_settings.items():
-                    try:
-                        getattr(roller, attr).set(value)
-                    except AttributeError:
-                        setattr(roller, attr, value)
-                roller.reset(loading=True)
-                h = len(roller.history) - 1
-                r += 1
-
-            group.navigate_history(desired_index=h)
-            g += 1
-
-        roller_groups.sort(key=lambda x: x.index)
-
-        maintain_group_indices()
-        for group in roller_groups:
-            group.rollers.sort(key=lambda x: x.index)
-            group.maintain_roller_indices()
-            for roller in group.rollers:
-                roller.apply_modifiers()
+        with self.transaction():
+            self.clear_groups()
 
-        maintain_tabstops()
+            if container.is_container(fpath):
+                group_dict, events = container.load(fpath)
+            else:
+                group_dict, events = journal.load(fpath)
 
-        self.pin()
-        self.autosave.set(autosave)
-        self.set_saved_title(fpath)
+            self.load_rng(group_dict.get('settings', {}).get('rng'))
+            try:
+                settings_dict = group_dict.pop('settings')
+                autosave      = (settings_dict['autosave'])
+                self.use_random_org.set(settings_dict['use_random_org'])
+                self.allow_odd     .set(settings_dict['allow_odd'     ])
+                self.always_on_top .set(settings_dict['always_on_top' ])
+                self.prefetch      .set(settings_dict['prefetch'      ])
+                self.saver.debounce = settings_dict['autosave_delay']
+            except KeyError:
+                pass
+
+            for g, (group_name, group_settings) in enumerate(journal.ordered(group_dict)):
+                self.create_group(g, 0)
+
+                group = roller_groups[g]
+                group.name.set(group_name)
+
+                rollers, group.store = store.load_group(fpath, group_settings, self.archive_dir)
+                group.next_rid = group.store.next_rid
+                for roller_name, roller_settings in rollers:
+                    roller_settings['name']  = roller_name
+                    roller_settings['stats'] = RunningStats.from_dict(roller_settings.get('stats'))
+                    group.pending.append(roller_settings)
+
+                group.stats = RunningStats.from_dict(group_settings.get('stats'))
+                if group.store.events:
+                    group.hist_index = group.store.events - 1
+                    group.history_frame.config(text=format_stamp(group.store.time))
+                group.set_collapsed(group_settings.get('collapsed', False))
+
+            maintain_tabstops()
+
+            self.pin()
+            self.toggle_random_org()
+            self.journal = self.open_journal(fpath, events)
+            self.autosave.set(autosave)
+            self.set_saved_title(fpath)
 
     def save_config(self, fpath=''):
         if not fpath:
-            fpath = asksaveasfilename(filetypes=[('JSON', '*.json'), ('All', '*.*')], defaultextension='.json')
+            fpath = asksaveasfilename(filetypes=file_types, defaultextension='.json')
         if not fpath:
             if '*' in self.master.title():
                 self.autosave.set(False)
             return
         self.fpath = fpath
 
+        self.saver.submit(self.prepare_snapshot(fpath))
+        self.set_saved_title(fpath)
+
+    def snapshot_config(self, binary=False):
         d1 = {}
         d1['settings'] = {'use_random_org': self.use_random_org.get(),
                           'allow_odd'     : self.allow_odd     .get(),
                           'always_on_top' : self.always_on_top .get(),
+                          'prefetch'      : self.prefetch      .get(),
+                          'autosave_delay': self.saver.debounce       ,
                           'autosave'      : self.autosave      .get()}
+        if self.seeded.get():
+            d1['settings']['rng'] = rng.seeded.to_dict()
         for group in roller_groups:
-            group.maintain_roller_indices()
             d2 = {}
             d2['index'] = group.index
+            d2['collapsed'] = group.collapsed
+            if group.stats.count:
+                d2['stats'] = group.stats.to_dict()
+            group.store.save(d2, {roller.rid for roller in group.rollers} | {spec['id'] for spec in group.pending}, binary)
             d2['rollers'] = {}
             for roller in group.rollers:
                 name = roller.name.get()
                 while name in d2['rollers']:
                     name += '!'
                 d2['rollers'][name] = {'index'    : roller.index          ,
-                                       'history'  : roller.history        ,
+                                       'id'       : roller.rid            ,
                                        'dice_qty' : roller.dice_qty .get(),
                                        'die_faces': roller.die_faces.get(),
                                        'modifier' : roller.modifier .get(),
                                        'finalmod' : roller.finalmod .get()}
+                if roller.expression.get():
+                    d2['rollers'][name]['expression'] = roller.expression.get()
+                if roller.stats.count:
+                    d2['rollers'][name]['stats'] = roller.stats.to_dict()
+            for i, spec in enumerate(group.pending, len(group.rollers)):
+                name = spec['name']
+                while name in d2['rollers']:
+                    name += '!'
+                d2['rollers'][name] = dict({k: v for k, v in spec.items() if k not in ('name', 'stats')}, index=i)
+                if spec['stats'].count:
+                    d2['rollers'][name]['stats'] = spec['stats'].to_dict()
             name = group.name.get()
             if name in d1:
                 name += '!'
             d1[name] = d2
 
-        with open(fpath, 'w') as f:
-            f.write(dumps(d1, indent=2, separators=(',', ': ')))
-
-        self.set_saved_title(fpath)
+        return d1
 
 
 class RollerGroup(LabelFrame):
@@ -269,16 +580,23 @@ class RollerGroup(LabelFrame):
         self.mainframe     = mainframe
         self.index         = index
         self.hist_index    = 0
+        self.store         = GroupStore(mainframe.archive_dir)
+        self.next_rid      = 0
         self.collapsed     = False
         self.rollers       = []
+        self.pending       = deque()
+        self.stats         = RunningStats()
+        self.stats_window  = None
+        self.first_row     = 0
+        self.scrollbar     = None
         self.control_frame = Frame(None)
         default_font       = ('Verdana', 10)
 
         self.name = StringVar()
-        self.name.trace('w', self.mainframe.set_unsaved_title)
+        self.name.trace('w', self.name_changed)
 
-        self.expand_img   = PhotoImage(data=b'R0lGODlhEAAQAIABAAAAAP///yH5BAEKAAEALAAAAAAQABAAAAIlhI+pq+EPHYo0TGjifRkfDYAdI33WUnZc6KmlyK5wNdMrg+dJAQA7')
-        self.collapse_img = PhotoImage(data=b'R0lGODlhEAAQAIABAAAAAP///yH5BAEKAAEALAAAAAAQABAAAAIfhI+pq+EPHYo0zAovlme/y3CGmJCeeWqbirEVA8dLAQA7'        )
+        self.expand_img   = image('expand'  )
+        self.collapse_img = image('collapse')
 
         self.collapse_btn  = Button    (self.control_frame, bd=0, image=self.collapse_img, command=self.show_hide                                       )
         self.menu_btn      = Menubutton(self.control_frame, bd=1, relief='solid', font=('Courier',  8), text='\u25e2', takefocus=1, highlightthickness=1)
@@ -287,9 +605,9 @@ class RollerGroup(LabelFrame):
         self.history_frame = LabelFrame(self.control_frame, bd=1, text='History', relief='solid', font=default_font, labelanchor='w')
         self.roll_frame    = LabelFrame(self.control_frame, bd=1, text='Roll'   , relief='solid', font=default_font, labelanchor='w')
 
-        self.roll_img    = PhotoImage(data=b'R0lGODlhDgARAIABAAAAAP///yH5BAEKAAEALAAAAAAOABEAAAIkjB+Ai6C83GOy0iqjM7ltPoFhKEKeKZJadynfVa6HlbAp3ZIFADs=')
-        self.left_arrow  = PhotoImage(data=b'R0lGODlhBwANAIABAAAAAP///yH5BAEKAAEALAAAAAAHAA0AAAITjA9nkMj+Apty2lvt0jt2VYFSAQA7')
-        self.right_arrow = PhotoImage(data=b'R0lGODlhBwANAIABAAAAAP///yH5BAEKAAEALAAAAAAHAA0AAAITRI5gGLrnXlzT1NsidEkx/zFHAQA7')
+        self.roll_img    = image('roll' )
+        self.left_arrow  = image('left' )
+        self.right_arrow = image('right')
 
         self.roll_btn      = Button(self.roll_frame   , bd=0, image=self.roll_img   , height=24, command=self.roll_group                                                                        )
         self.hist_prev_btn = Button(self.history_frame, bd=0, image=self.left_arrow , height=24, width=16, repeatdelay=250, repeatinterval=100, command=lambda: self.navigate_history(offset=-1))
@@ -310,28 +628,109 @@ class RollerGroup(LabelFrame):
         self.name.set('Group {}'.format(len(roller_groups) + 1))
         self.grid(row=index, padx=4, pady=4, sticky='w')
 
+    @property
+    def history(self):
+        return self.store.history
+
+    @property
+    def archive(self):
+        return self.store.archive
+
+    def name_changed(self, *args):
+        self.mainframe.record('group', g=self.index, v=self.name.get())
+        self.mainframe.set_unsaved_title()
+
     def show_hide(self):
+        self.set_collapsed(not self.collapsed)
         if self.collapsed:
-            for roller in self.rollers:
-                roller.grid()
-            self.collapse_btn.config(image=self.collapse_img)
-            self.collapsed = False
-        else:
-            for roller in self.rollers:
-                roller.grid_remove()
-            self.collapse_btn.config(image=self.expand_img)
             width = 28 + self.collapse_btn.winfo_width() + self.menu_btn.winfo_width() + self.name_entry.winfo_width()
             self.config(height=36, width=width)
-            self.collapsed = True
+        self.mainframe.record('collapsed', g=self.index, v=self.collapsed)
+        self.mainframe.set_unsaved_title()
+
+    def set_collapsed(self, collapsed):
+        self.collapse_btn.config(image=self.expand_img if collapsed else self.collapse_img)
+        self.show_rows(collapsed=collapsed)
+
+    def row_count(self):
+        return len(self.rollers) + len(self.pending)
+
+    def window(self):
+        if self.collapsed:
+            return range(0)
+        return range(self.first_row, min(self.first_row + visible_rows, self.row_count()))
+
+    def shows(self, i):
+        return not self.collapsed and self.first_row <= i < self.first_row + visible_rows
+
+    def show_rows(self, first=None, collapsed=None):
+        old = self.window()
+        if first is not None:
+            self.first_row = max(0, min(first, self.row_count() - visible_rows))
+        if collapsed is not None:
+            self.collapsed = collapsed
+        new = self.window()
+
+        self.materialize(new.stop)
+        for i in old:
+            if i not in new and i < len(self.rollers):
+                self.rollers[i].grid_remove()
+        for i in new:
+            if i not in old:
+                self.rollers[i].grid(row=i)
+        self.update_scrollbar()
+
+    def refresh_rows(self):
+        if self.first_row and self.row_count() <= visible_rows:
+            self.show_rows(0)
+            return
+        self.materialize(self.window().stop)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = self.row_count()
+        if self.collapsed or total <= visible_rows:
+            if self.scrollbar is not None:
+                self.scrollbar.grid_remove()
+            return
+        if self.scrollbar is None:
+            self.scrollbar = Scrollbar(self, command=self.scroll)
+        self.scrollbar.grid(row=self.first_row, column=1, rowspan=visible_rows, sticky='ns')
+        self.scrollbar.set(self.first_row / total, (self.first_row + visible_rows) / total)
+
+    def scroll(self, action, n, what='units'):
+        if action == 'moveto':
+            self.show_rows(int(float(n) * self.row_count()))
+        else:
+            self.show_rows(self.first_row + int(n) * (visible_rows if what == 'pages' else 1))
+
+    def materialize(self, stop=None):
+        if stop is None:
+            stop = self.row_count()
+        if not self.pending or len(self.rollers) >= stop:
+            return
+        specs = [self.pending.popleft() for i in range(min(len(self.pending), stop - len(self.rollers)))]
+        for spec in self.pending_specs(specs):
+            self.rollers.append(Roller(self, len(self.rollers), spec))
+
+    def pending_specs(self, specs):
+        state = self.history.state_at(self.hist_index, {spec['id'] for spec in specs}) if len(self.history) else {}
+        return [dict(spec, **state.get(spec['id'], {})) for spec in specs]
+
+    def pending_rows(self):
+        return [PendingRow(self, spec, i) for i, spec in enumerate(self.pending_specs(self.pending), len(self.rollers))]
 
     def create_menu(self):
-        menu = Menu(self.menu_btn, tearoff=0, postcommand=maintain_group_indices)
+        menu = Menu(self.menu_btn, tearoff=0)
 
         menu.add_command(label='Add'          , underline=0, command=        self.add_group             )
         menu.add_command(label='Clone'        , underline=0, command=lambda: self.add_group (clone=True))
         menu.add_command(label='Up'           , underline=0, command=lambda: self.move_group(offset=-1) )
         menu.add_command(label='Down'         , underline=0, command=lambda: self.move_group(offset= 1) )
+        menu.add_command(label='Simulate'     , underline=0, command=        self.simulate              )
+        menu.add_command(label='Stats'        , underline=1, command=        self.show_stats            )
         menu.add_separator() #  -------------
+        menu.add_command(label='Retention'    , underline=2, command=        self.set_retention         )
         menu.add_command(label='Clear history', underline=6, command=        self.clear_history         )
         menu.add_command(label='Remove'       , underline=0, command=        self.remove_group          )
 
@@ -340,106 +739,232 @@ class RollerGroup(LabelFrame):
     def add_group(self, clone=False):
         destination_index = self.index + 1
 
-        group = RollerGroup(self.mainframe, destination_index)
-        roller_groups.insert(group.index, group)
-
-        for i in range(destination_index, len(roller_groups)):
-            roller_groups[i].grid(row=i + 1)
-
-        if clone:
-            for roller in self.rollers:
-                new_roller = Roller(group, self.rollers.index(roller))
-                new_roller.name     .set(roller.name     .get())
-                new_roller.dice_qty .set(roller.dice_qty .get())
-                new_roller.die_faces.set(roller.die_faces.get())
-                new_roller.modifier .set(roller.modifier .get())
-                new_roller.finalmod .set(roller.finalmod .get())
-                group.rollers.append(new_roller)
-            group.name.set(self.name.get())
-        else:
-            group.rollers.append(Roller(group, 0))
-            group.name.set(group.name.get())
+        with self.mainframe.transaction():
+            group = RollerGroup(self.mainframe, destination_index)
+            roller_groups.insert(group.index, group)
+            maintain_group_indices(destination_index + 1)
+
+            if clone:
+                self.materialize()
+                for i, roller in enumerate(self.rollers):
+                    new_roller = Roller(group, i)
+                    new_roller.name     .set(roller.name     .get())
+                    new_roller.dice_qty .set(roller.dice_qty .get())
+                    new_roller.die_faces.set(roller.die_faces.get())
+                    new_roller.modifier .set(roller.modifier .get())
+                    new_roller.finalmod .set(roller.finalmod .get())
+                    new_roller.expression.set(roller.expression.get())
+                    group.rollers.append(new_roller)
+                group.name.set(self.name.get())
+            else:
+                group.rollers.append(Roller(group, 0))
+                group.name.set(group.name.get())
 
-        maintain_tabstops()
+            restack_group(group.index)
+            self.mainframe.restructure()
 
-        self.mainframe.editmenu.entryconfigure(
-            self.mainframe.editmenu.index('end'), command=lambda: self.add_group(clone=clone))
-        self.mainframe.bind_all('<Control-r>', lambda e: self.add_group(clone=clone))
+        self.mainframe.repeatable(self, 'add_group', clone=clone)
 
     def move_group(self, offset=0, destination_index=0):
         if not destination_index:
             destination_index = self.index + offset
 
         if destination_index >= 0:
-            group = roller_groups.pop(self.index)
-            roller_groups.insert(destination_index, group)
-
-        maintain_group_indices()
-        self.name.set(self.name.get())
-
-        self.mainframe.editmenu.entryconfigure(
-            self.mainframe.editmenu.index('end'), command=lambda: self.move_group(offset=offset))
-        self.mainframe.bind_all('<Control-r>', lambda e: self.move_group(offset=offset))
+            source_index = self.index
+            roller_groups.pop(source_index)
+            roller_groups.insert(destination_index, self)
+            maintain_group_indices(min(source_index, destination_index), max(source_index, destination_index) + 1)
+            restack_group(self.index)
+
+        self.mainframe.restructure()
+
+        self.mainframe.repeatable(self, 'move_group', offset=offset)
+
+    def simulate(self):
+        trials = askinteger('Simulate', 'Number of trials', parent=self,
+                            initialvalue=1000000, minvalue=1, maxvalue=1000000000)
+        if trials:
+            SimulationWindow(self, trials)
+
+    def set_retention(self):
+        keep = askinteger('Retention', 'Detailed rolls to keep (0 keeps all)', parent=self,
+                          initialvalue=self.store.retention.get('keep', 0), minvalue=0)
+        if keep is None:
+            return
+        retention = {}
+        if keep:
+            retention = {'keep'   : keep,
+                         'archive': askyesno('Retention', 'Archive older rolls to a side file?\n\n'
+                                             'Otherwise they are only kept as hourly rollups.', parent=self)}
+        self.store.retention = retention
+        self.history.retain(retention)
+        if len(self.history):
+            self.hist_index = max(self.hist_index, self.history.oldest)
+            self.navigate_history()
+        self.refresh_stats()
+        self.mainframe.restructure()
+
+    def rollup_lines(self):
+        return ['{}  {:>6} rolls'.format(format_hour(hour), rollup['events'])
+                for hour, rollup in sorted(self.history.rollups.items())]
 
     def clear_history(self):
         for roller in self.rollers:
             roller.reset()
-            roller.history = []
+            roller.stats = RunningStats()
+            roller.refresh_stats()
+        for spec in self.pending:
+            spec['stats'] = RunningStats()
+        self.stats = RunningStats()
+        self.refresh_stats()
+        self.history.clear()
         self.history_frame.config(text='History')
+        self.mainframe.restructure()
+
+    def show_stats(self):
+        if self.stats_window is None:
+            self.stats_window = StatsWindow(self)
+        self.stats_window.lift()
+
+    def refresh_stats(self):
+        if self.stats_window is not None:
+            self.stats_window.refresh()
 
     def remove_group(self, override=False):
         if len(roller_groups) > 1 or override:
             self.grid_remove()
-            roller_groups.remove(self)
+            roller_groups.pop(self.index)
+            maintain_group_indices(self.index)
+            if self.archive is not None:
+                self.archive.close()
+            if self.stats_window is not None:
+                self.stats_window.close()
             self.name.set('')
+            self.mainframe.restructure()
 
-    def maintain_roller_indices(self):
-        for roller in self.rollers:
-            roller.index = self.rollers.index(roller)
-            roller.grid(row=roller.index)
+    def to_config(self):
+        rollers = [roller.to_config() for roller in self.rollers]
+        rollers.extend(row.config for row in self.pending_rows())
+        return engine.GroupConfig(self.name.get(), self.index, rollers)
+
+    def maintain_roller_indices(self, start=0, stop=None):
+        reindex(self.rollers, start, stop)
+
+    def regrid(self):
+        self.grid(row=self.index)
 
     def roll_group(self):
-        for roller in self.rollers:
-            roller.roll()
+        self.dispatch_rolls(self.rollers + self.pending_rows())
+
+        self.mainframe.repeatable(self, 'roll_group')
+
+    def model_rolls(self, rollers, n, source=None):
+        for roller in rollers:
+            roller.roll_params()
+        config = engine.GroupConfig(self.name.get(), self.index, [roller.to_config() for roller in rollers])
+        whole  = len(rollers) == len(self.rollers) + len(self.pending)
+        for index in model_rolls(self.history, [roller.rid for roller in rollers], config,
+                                 [roller.stats for roller in rollers], n, source, self.stats if whole else None):
+            self.hist_index = index
+            yield index
+
+    def dispatch_rolls(self, rollers):
+        if self.mainframe.rolling:
+            return
+        self.mainframe.rolling = True
 
-        self.navigate_history()
+        source         = self.mainframe.rng_source()
+        prefetch       = self.mainframe.prefetch      .get()
+        params         = [roller.roll_params() for roller in rollers]
+        batch          = [None] * len(rollers)
+        pending        = [len(rollers)]
+        lock           = Lock()
 
-        self.mainframe.editmenu.entryconfigure(
-            self.mainframe.editmenu.index('end'), command=lambda: self.roll_group())
-        self.mainframe.bind_all('<Control-r>', lambda e: self.roll_group())
+        def collect(span, future):
+            try:
+                results = future.result()
+            except Exception:
+                results = [[] for i in span]
+            with lock:
+                for i, r in zip(span, results):
+                    batch[i] = r
+                pending[0] -= len(span)
+                done = not pending[0]
+            if done:
+                self.after(0, lambda: self.apply_rolls(rollers, params, batch))
+
+        self.history_frame.config(text='Rolling')
+        if source is rng.seeded:
+            future = roll_pool.submit(lambda: [draw_dice(rolls, sides, source) for rolls, sides in params])
+            future.add_done_callback(lambda f: collect(range(len(params)), f))
+            return
+        if source is entropy_pool and not prefetch and all(sides for rolls, sides in params):
+            future = roll_pool.submit(draw_group, params)
+            future.add_done_callback(lambda f: collect(range(len(params)), f))
+            return
+        for i, (rolls, sides) in enumerate(params):
+            future = roll_pool.submit(lambda r=rolls, s=sides: [draw_dice(r, s, source)])
+            future.add_done_callback(lambda f, i=i: collect(range(i, i + 1), f))
+
+    def apply_rolls(self, rollers, params, batch):
+        try:
+            with self.mainframe.transaction():
+                for roller, (rolls, sides), results in zip(rollers, params, batch):
+                    roller.apply_roll(results, rolls, sides)
+
+                totals = [roller.record_stats() for roller in rollers]
+                if len(rollers) == len(self.rollers) + len(self.pending):
+                    self.stats.add(sum(totals))
+                    self.refresh_stats()
+
+                rolls = {roller.rid: roller.create_hist_record() for roller in rollers}
+                stamp = now()
+
+                self.hist_index = self.history.append(stamp, rolls)
+                self.mainframe.record('roll', g=self.index, event={'time' : stamp,
+                                                                   'rolls': {str(k): v for k, v in rolls.items()}})
+                if self.mainframe.seeded.get():
+                    self.mainframe.record_rng()
+                self.navigate_history(desired_index=self.hist_index)
+        finally:
+            self.mainframe.rolling = False
 
     def navigate_history(self, offset=0, desired_index=0):
-        hist_len = len(self.rollers[0].history)
+        hist_len = len(self.history)
         if not hist_len:
             return
 
         if not desired_index:
             desired_index = self.hist_index + offset
 
-        if desired_index >= -1 and desired_index <= hist_len:
-            if desired_index == -1:
-                desired_index = 0
-            if desired_index == hist_len:
-                desired_index = hist_len - 1
-            for roller in self.rollers:
-                hist_dict      = roller.history[desired_index]
-                roller.results = hist_dict['results']
-                roller.dice_qty    .set(hist_dict['dice_qty'    ])
-                roller.die_faces   .set(hist_dict['die_faces'   ])
-                roller.modifier    .set(hist_dict['modifier'    ])
-                roller.results_text.set(hist_dict['results_text'])
-                roller.finalmod    .set(hist_dict['finalmod'    ])
-                self.history_frame.config(text=hist_dict['timestamp'])
+        first = self.history.oldest
+        if desired_index >= min(first, self.hist_index) - 1 and desired_index <= hist_len:
+            desired_index = max(first, min(desired_index, hist_len - 1))
+            state = self.history.state_at(desired_index)
+            with self.mainframe.transaction():
+                for roller in self.rollers:
+                    hist_dict = state.get(roller.rid)
+                    if hist_dict is None:
+                        roller.reset(loading=True)
+                        roller.apply_modifiers(True)
+                        continue
+                    roller.dice = hist_dict['dice']
+                    if roller.expression.get() != hist_dict['expression']:
+                        roller.expression.set(hist_dict['expression'])
+                    if not hist_dict['expression']:
+                        roller.dice_qty .set(hist_dict['dice_qty'   ])
+                        roller.die_faces.set(hist_dict['die_faces'  ])
+                    roller.modifier    .set(hist_dict['modifier'    ])
+                    roller.results_text.set(hist_dict['results_text'])
+                    roller.finalmod    .set(hist_dict['finalmod'    ])
+            self.history_frame.config(text=self.history.label(desired_index))
             self.hist_index = desired_index
 
         self.maintain_result_widths()
 
     def maintain_result_widths(self):
         for roller in self.rollers:
-            w = len(roller.results_text.get())
-            if w > 80:
-                w = 80
-            roller.results_entry.config(width=w)
+            roller.maintain_result_width()
 
 
 class NumericSpinner(Frame):
@@ -461,8 +986,8 @@ class NumericSpinner(Frame):
         self.entry     = Entry(self, width=len(str(self.variable.get())), textvariable=self.variable, bd=0, font=('Courier', 14), state='readonly', relief='solid')
         self.btn_frame = Frame(self)
 
-        self.up_arrow = PhotoImage(data=b'R0lGODlhCQAFAIABAAAAAP///yH5BAEKAAEALAAAAAAJAAUAAAILjAOnwIrcDJxvwgIAOw==')
-        self.dn_arrow = PhotoImage(data=b'R0lGODlhCQAFAIABAAAAAP///yH5BAEKAAEALAAAAAAJAAUAAAIKhH+BGYoNGWxgFgA7'    )
+        self.up_arrow = image('up'  )
+        self.dn_arrow = image('down')
 
         self.up_btn = Button(self.btn_frame, width=10, height=8, bd=0, image=self.up_arrow, repeatdelay=500, repeatinterval=100, command=lambda: self.step( 1))
         self.dn_btn = Button(self.btn_frame, width=10, height=8, bd=0, image=self.dn_arrow, repeatdelay=500, repeatinterval=100, command=lambda: self.step(-1))
@@ -488,29 +1013,204 @@ class NumericSpinner(Frame):
         self.entry.config(width=len(str(n)))
 
 
+class OddsWindow(Toplevel):
+    def __init__(self, roller):
+        Toplevel.__init__(self, roller)
+
+        self.roller = roller
+        self.text   = StringVar()
+        self.label  = Label(self, textvariable=self.text, font=('Courier', 10), justify='left')
+        self.traces = [(var, var.trace('w', self.refresh)) for var in (roller.name     ,
+                                                                        roller.dice_qty ,
+                                                                        roller.die_faces,
+                                                                        roller.modifier ,
+                                                                        roller.finalmod ,
+                                                                        roller.expression)]
+
+        self.label.grid(padx=8, pady=8)
+        self.resizable(0, 0)
+        self.title('Odds')
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.refresh()
+
+    def refresh(self, *args):
+        config  = self.roller.to_config()
+        dist    = odds.distribution(config)
+        special = odds.special_odds(config)
+
+        self.text.set('\n'.join((
+            odds.describe(config),
+            'Total   {} .. {}   mean {:.2f}   sd {:.2f}'.format(dist.low, dist.high, dist.mean, dist.std),
+            'Median  {}   90% within {} .. {}'.format(dist.quantile(.5), dist.quantile(.05), dist.quantile(.95)),
+            '\u25b2 {:.1%}   \u25bc {:.1%}   either {:.1%}'.format(special['crit'], special['fail'], special['either']))))
+
+    def close(self):
+        for var, cbname in self.traces:
+            var.trace_vdelete('w', cbname)
+        self.roller.odds_window = None
+        self.destroy()
+
+
+class StatsWindow(Toplevel):
+    def __init__(self, owner):
+        Toplevel.__init__(self, owner)
+
+        self.owner = owner
+        self.text  = StringVar()
+        self.label = Label(self, textvariable=self.text, font=('Courier', 10), justify='left')
+        self.trace = owner.name.trace('w', self.refresh)
+
+        self.label.grid(padx=8, pady=8)
+        self.resizable(0, 0)
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.refresh()
+
+    def refresh(self, *args):
+        stats = self.owner.stats
+        self.title('Stats  -  {}'.format(self.owner.name.get()))
+        if not stats.count:
+            self.text.set('No rolls yet')
+            return
+
+        lines = ['Rolls {}   mean {:.2f}   sd {:.2f}   {} .. {}'.format(
+            stats.count, stats.mean, stats.std, stats.low, stats.high)]
+        if stats.dice:
+            lines.append('\u25b2 {:.1%}   \u25bc {:.1%}   of {} dice'.format(stats.crit_rate, stats.fail_rate, stats.dice))
+        lines.append('')
+        histogram = stats.histogram()
+        peak      = max(n for low, high, n in histogram)
+        for low, high, n in histogram:
+            label = str(low) if low == high else '{}..{}'.format(low, high)
+            lines.append('{:>9} {:<30} {}'.format(label, '\u2588' * round(30 * n / peak), n))
+        fairness = stats.fairness()
+        if fairness:
+            lines.append('')
+        for faces, n, chi2, dof, p in fairness:
+            if chi2 is None:
+                lines.append('d{:<4} {} dice, too few for a fairness test'.format(faces, n))
+            else:
+                lines.append('d{:<4} \u03c7\u00b2 {:.2f}   {} df   p {:.3f}'.format(faces, chi2, dof, p))
+        rollups = self.owner.rollup_lines()
+        if rollups:
+            lines += ['', 'Rolled up'] + rollups
+        self.text.set('\n'.join(lines))
+
+    def close(self):
+        self.owner.name.trace_vdelete('w', self.trace)
+        self.owner.stats_window = None
+        self.destroy()
+
+
+class SimulationWindow(Toplevel):
+    def __init__(self, group, trials):
+        Toplevel.__init__(self, group)
+
+        self.group   = group
+        self.trials  = trials
+        self.cancel  = Event()
+        self.configs = [g.to_config() for g in roller_groups]
+        self.subject = roller_groups.index(group)
+        self.text    = StringVar()
+        self.label   = Label(self, textvariable=self.text, font=('Courier', 10), justify='left')
+
+        self.label.grid(padx=8, pady=8)
+        self.resizable(0, 0)
+        self.title('Simulating {}'.format(self.group.name.get()))
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.show_progress(0, trials)
+
+        future = roll_pool.submit(simulate.simulate, self.configs, trials, cancel=self.cancel,
+                                  progress=lambda done, total: self.group.after(0, self.show_progress, done, total))
+        future.add_done_callback(lambda f: self.group.after(0, self.show_result, f))
+
+    def show_progress(self, done, total):
+        if not self.cancel.is_set():
+            self.text.set('{} / {} trials  ({:.0%})'.format(done, total, done / total))
+
+    def show_result(self, future):
+        if self.cancel.is_set():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            self.text.set('Simulation failed: {}'.format(e))
+            return
+
+        i     = self.subject
+        lines = ['{}:  {} trials'.format(result.names[i], result.trials),
+                 'Total   {} .. {}   mean {:.2f}   sd {:.2f}'.format(result.low(i), result.high(i), result.mean(i), result.std(i))]
+        for j, name in enumerate(result.names):
+            if j != i:
+                lines.append('vs {:<16} win {:6.2%}   tie {:6.2%}   lose {:6.2%}'.format(
+                    name, result.p_beats(i, j), result.p_tie(i, j), result.p_beats(j, i)))
+        self.text.set('\n'.join(lines))
+        self.title('Simulated {}'.format(result.names[i]))
+
+    def close(self):
+        self.cancel.set()
+        self.destroy()
+
+
+class PendingRow:
+    def __init__(self, group, spec, index):
+        self.group  = group
+        self.rid    = spec['id']
+        self.stats  = spec['stats']
+        self.dice   = None
+        self.config = engine.RollerConfig.from_dict(spec['name'], dict(spec, index=index))
+
+    def roll_params(self):
+        config = self.config
+        if config.expression:
+            return config.expression, 0
+
+        if self.group.mainframe.allow_odd.get() % 2 == 0 and config.die_faces % 2 != 0:
+            config.die_faces -= 1
+
+        return config.dice_qty, config.die_faces
+
+    def to_config(self):
+        return self.config
+
+    def apply_roll(self, results, rolls, sides):
+        if not results:
+            results = draw_dice(rolls, sides)
+
+        self.dice = engine.Dice.rolled(results, sides) if sides else results
+
+    def record_stats(self):
+        total = self.dice.total(self.config.modifier, self.config.finalmod)
+        self.stats.add(total, self.dice, self.config.die_faces)
+        return total
+
+    def create_hist_record(self):
+        return engine.hist_record(self.config, self.dice)
+
+
 class Roller(Frame):
-    def __init__(self, group, index):
+    def __init__(self, group, index, spec=None):
         Frame.__init__(self, group)
 
-        self.group   = group
-        self.index   = index
-        self.results = [0]
-        self.history = []
+        self.group        = group
+        self.index        = index
+        self.rid          = group.next_rid if spec is None else spec['id']
+        self.dice         = engine.Dice.blank(1)
+        self.result_width = 0
+        self.stats        = RunningStats()
+        self.odds_window  = None
+        self.stats_window = None
+
+        if spec is None:
+            group.next_rid += 1
 
         self.name         = StringVar()
         self.dice_qty     = IntVar()
         self.die_faces    = IntVar()
         self.modifier     = IntVar()
         self.finalmod     = IntVar()
+        self.expression   = StringVar()
         self.results_text = StringVar()
 
-        self.name        .trace('w', self.group.mainframe.set_unsaved_title)
-        self.dice_qty    .trace('w', self.group.mainframe.set_unsaved_title)
-        self.die_faces   .trace('w', self.group.mainframe.set_unsaved_title)
-        self.modifier    .trace('w', self.group.mainframe.set_unsaved_title)
-        self.finalmod    .trace('w', self.group.mainframe.set_unsaved_title)
-        self.results_text.trace('w', self.group.mainframe.set_unsaved_title)
-
         default_font = ('Courier', 14)
 
         self.menu_btn   = Menubutton(self, bd=1, relief='solid', font=('Courier',  8), text='\u25e2', takefocus=1, highlightthickness=1)
@@ -523,8 +1223,9 @@ class Roller(Frame):
         self.dice_lbl       = Label(self, text=' d'    , font=default_font                                                            )
         self.modifier_lbl   = Label(self, text='\u002b', font=default_font                                                            )
         self.finalmod_lbl   = Label(self, text='\u002b', font=default_font                                                            )
+        self.expression_lbl = Label(self, textvariable=self.expression, font=default_font                                             )
 
-        self.roll_btn      = Button(self, bd=0, image=self.group.roll_img, command=lambda: self.roll(single=True))
+        self.roll_btn      = Button(self, bd=0, image=self.group.roll_img, command=self.roll)
         self.results_entry = Entry (self, bd=0, relief='solid', font=default_font, width=0, textvariable=self.results_text, state='readonly', justify='center')
 
         self.menu_btn.config(menu=self.create_menu())
@@ -541,98 +1242,219 @@ class Roller(Frame):
         self.finalmod_lbl  .grid(row=index, column=9 , padx=(6, 6))
         self.finalmod_spin .grid(row=index, column=10, padx=(0, 4))
 
-        self.name        .set('Roller {}'.format(len(self.group.rollers) + 1))
-        self.die_faces   .set(10)
-        self.results_text.set('0 = 0')
+        if spec is None:
+            self.name        .set('Roller {}'.format(len(self.group.rollers) + 1))
+            self.die_faces   .set(10)
+            self.results_text.set('0 = 0')
+        else:
+            self.load(spec)
+
+        self.name        .trace('w', lambda *args: self.field_changed('name'     ))
+        self.dice_qty    .trace('w', lambda *args: self.field_changed('dice_qty' ))
+        self.die_faces   .trace('w', lambda *args: self.field_changed('die_faces'))
+        self.modifier    .trace('w', lambda *args: self.field_changed('modifier' ))
+        self.finalmod    .trace('w', lambda *args: self.field_changed('finalmod' ))
+        self.expression  .trace('w', lambda *args: self.expression_changed()       )
+        self.results_text.trace('w', self.group.mainframe.set_unsaved_title)
+        self.fields = {key: getattr(self, key).get() for key in roller_fields}
 
         self.grid(row=index, sticky='w', pady=4)
+        if not group.shows(index):
+            self.grid_remove()
 
-    def create_menu(self):
-        menu = Menu(self.menu_btn, tearoff=0, postcommand=self.group.maintain_roller_indices)
+    def load(self, spec):
+        self.name     .set(spec['name'])
+        self.dice_qty .set(spec.get('dice_qty' , 1 ))
+        self.die_faces.set(spec.get('die_faces', 10))
+        self.modifier .set(spec.get('modifier' , 0 ))
+        self.finalmod .set(spec.get('finalmod' , 0 ))
+        self.expression.set(spec.get('expression', ''))
+        self.stats = spec.get('stats') or RunningStats()
+        self.show_fields()
+        self.dice = spec['dice'] if 'dice' in spec else self.blank_dice()
+        self.dice_qty_spin .step(0)
+        self.die_faces_spin.step(0)
+        self.modifier_spin .step(0)
+        self.finalmod_spin .step(0)
+        self.results_text.set(self.dice.text(self.modifier.get(), self.finalmod.get()))
+        self.maintain_result_width()
 
-        menu.add_command(label='Add'   , underline=0, command=        self.add_roller             )
-        menu.add_command(label='Clone' , underline=0, command=lambda: self.add_roller (clone=True))
-        menu.add_command(label='Up'    , underline=0, command=lambda: self.move_roller(offset=-1) )
-        menu.add_command(label='Down'  , underline=0, command=lambda: self.move_roller(offset= 1) )
-        menu.add_separator() #  ------
-        menu.add_command(label='Remove', underline=0, command=        self.remove_roller          )
+    def regrid(self):
+        if self.group.shows(self.index):
+            self.grid(row=self.index)
+        else:
+            self.grid_remove()
+
+    def create_menu(self):
+        menu = Menu(self.menu_btn, tearoff=0)
+
+        menu.add_command(label='Add'       , underline=0, command=        self.add_roller             )
+        menu.add_command(label='Clone'     , underline=0, command=lambda: self.add_roller (clone=True))
+        menu.add_command(label='Up'        , underline=0, command=lambda: self.move_roller(offset=-1) )
+        menu.add_command(label='Down'      , underline=0, command=lambda: self.move_roller(offset= 1) )
+        menu.add_command(label='Odds'      , underline=0, command=        self.show_odds              )
+        menu.add_command(label='Stats'     , underline=0, command=        self.show_stats             )
+        menu.add_command(label='Expression', underline=0, command=        self.edit_expression        )
+        menu.add_separator() #  ----------
+        menu.add_command(label='Remove'    , underline=0, command=        self.remove_roller          )
 
         return menu
 
+    def field_changed(self, key):
+        value = getattr(self, key).get()
+        if self.fields.get(key) == value:
+            return
+        self.fields[key] = value
+        self.group.mainframe.record('roller', g=self.group.index, r=self.index, k=key, v=value)
+        self.group.mainframe.set_unsaved_title()
+
+    def expression_changed(self):
+        self.field_changed('expression')
+        self.show_fields()
+
+    def show_fields(self):
+        classic = (self.dice_qty_spin, self.dice_lbl, self.die_faces_spin)
+        if self.expression.get():
+            for widget in classic:
+                widget.grid_remove()
+            self.expression_lbl.grid(row=self.index, column=2, columnspan=3, padx=(4, 0))
+        else:
+            self.expression_lbl.grid_remove()
+            for widget in classic:
+                widget.grid()
+
+    def edit_expression(self):
+        text = askstring('Expression', 'Dice expression, e.g. 4d6kh3 or 8d10!>=8 (blank for classic)',
+                         parent=self, initialvalue=self.expression.get())
+        if text is None:
+            return
+        text = text.strip()
+        if text:
+            try:
+                text = expression.compiled(text).text
+            except ValueError as e:
+                showerror('Expression', str(e))
+                return
+        with self.group.mainframe.transaction():
+            self.expression.set(text)
+            self.reset()
+
+    def to_config(self):
+        return engine.RollerConfig(name     =self.name     .get(),
+                                   dice_qty =self.dice_qty .get(),
+                                   die_faces=self.die_faces.get(),
+                                   modifier =self.modifier .get(),
+                                   finalmod =self.finalmod .get(),
+                                   index    =self.index          ,
+                                   expression=self.expression.get())
+
     def create_hist_record(self):
-        record = {
-            'dice_qty'    : self.dice_qty    .get() ,
-            'die_faces'   : self.die_faces   .get() ,
-            'modifier'    : self.modifier    .get() ,
-            'results_text': self.results_text.get() ,
-            'finalmod'    : self.finalmod    .get() ,
-            'timestamp'   : str(dt.now().time())[:8],
-            'results'     : self.results            }
-        return record
+        return engine.hist_record(self.to_config(), self.dice)
 
     def add_roller(self, clone=False):
         destination_index = self.index + 1
 
         roller = Roller(self.group, destination_index)
         self.group.rollers.insert(roller.index, roller)
+        self.group.maintain_roller_indices(destination_index + 1)
 
-        for i in range(destination_index, len(self.group.rollers)):
-            self.group.rollers[i].grid(row=i + 1)
+        with self.group.mainframe.transaction():
+            if clone:
+                roller.name     .set(self.name     .get())
+                roller.dice_qty .set(self.dice_qty .get())
+                roller.die_faces.set(self.die_faces.get())
+                roller.modifier .set(self.modifier .get())
+                roller.finalmod .set(self.finalmod .get())
+                roller.expression.set(self.expression.get())
+                roller.reset()
 
-        if clone:
-            roller.name     .set(self.name     .get())
-            roller.dice_qty .set(self.dice_qty .get())
-            roller.die_faces.set(self.die_faces.get())
-            roller.modifier .set(self.modifier .get())
-            roller.finalmod .set(self.finalmod .get())
-            roller.reset()
-
-        for h in self.history:
-            record = roller.create_hist_record()
-            record['timestamp'] = h['timestamp']
-            roller.history.append(record)
+            roller.apply_modifiers()
 
-        roller.apply_modifiers()
+            restack(self.group.rollers, roller.index)
+            self.group.refresh_rows()
+            if not self.group.shows(roller.index):
+                self.group.show_rows(roller.index - visible_rows + 1)
+            self.group.mainframe.restructure()
 
-        for r in self.group.rollers:
-            r.lift()
-
-        self.group.mainframe.editmenu.entryconfigure(
-            self.group.mainframe.editmenu.index('end'), command=lambda: self.add_roller(clone=clone))
-        self.group.mainframe.bind_all('<Control-r>', lambda e: self.add_roller(clone=clone))
+        self.group.mainframe.repeatable(self, 'add_roller', clone=clone)
 
     def move_roller(self, offset=0, destination_index=0):
         if not destination_index:
             destination_index = self.index + offset
 
         if destination_index >= 0:
-            roller = self.group.rollers.pop(self.index)
-            self.group.rollers.insert(destination_index, roller)
-
-        self.group.maintain_roller_indices()
-        self.name.set(self.name.get())
-
-        self.group.mainframe.editmenu.entryconfigure(
-            self.group.mainframe.editmenu.index('end'), command=lambda: self.move_roller(offset=offset))
-        self.group.mainframe.bind_all('<Control-r>', lambda e: self.move_roller(offset=offset))
+            source_index = self.index
+            self.group.rollers.pop(source_index)
+            self.group.rollers.insert(destination_index, self)
+            self.group.maintain_roller_indices(min(source_index, destination_index), max(source_index, destination_index) + 1)
+            restack(self.group.rollers, self.index)
+
+        self.group.mainframe.restructure()
+
+        self.group.mainframe.repeatable(self, 'move_roller', offset=offset)
+
+    def show_odds(self):
+        if self.odds_window is None:
+            self.odds_window = OddsWindow(self)
+        self.odds_window.lift()
+
+    def show_stats(self):
+        if self.stats_window is None:
+            self.stats_window = StatsWindow(self)
+        self.stats_window.lift()
+
+    def refresh_stats(self):
+        if self.stats_window is not None:
+            self.stats_window.refresh()
+
+    def rollup_lines(self):
+        lines = []
+        for hour, rollup in sorted(self.group.history.rollups.items()):
+            stats = rollup['rollers'].get(self.rid)
+            if stats is not None:
+                lines.append('{}  {:>6} rolls   mean {:.2f}   {} .. {}'.format(
+                    format_hour(hour), stats.count, stats.mean, stats.low, stats.high))
+        return lines
+
+    def record_stats(self):
+        total = self.dice.total(self.modifier.get(), self.finalmod.get())
+        self.stats.add(total, self.dice, self.die_faces.get())
+        self.refresh_stats()
+        return total
 
     def remove_roller(self):
-        if len(self.group.rollers) > 1:
+        if self.group.row_count() > 1:
             self.grid_remove()
-            self.group.rollers.remove(self)
+            self.group.rollers.pop(self.index)
+            self.group.maintain_roller_indices(self.index)
+            self.group.refresh_rows()
             self.name.set('')
+            self.group.mainframe.restructure()
+            if self.odds_window is not None:
+                self.odds_window.close()
+            if self.stats_window is not None:
+                self.stats_window.close()
+
+    def blank_dice(self):
+        return engine.Dice.blank(1 if self.expression.get() else self.dice_qty.get())
 
     def reset(self, loading=False):
-        self.results = [0 for i in range(self.dice_qty.get())]
+        self.dice = self.blank_dice()
         self.dice_qty_spin .step(0)
         self.die_faces_spin.step(0)
         self.modifier_spin .step(0)
         self.finalmod_spin .step(0)
         if not loading:
             self.apply_modifiers()
-            self.group.maintain_result_widths()
 
-    def roll(self, single=False):
+    def roll(self):
+        self.group.dispatch_rolls([self])
+        self.group.mainframe.repeatable(self, 'roll')
+
+    def roll_params(self):
+        if self.expression.get():
+            return self.expression.get(), 0
+
         rolls = self.dice_qty .get()
         sides = self.die_faces.get()
 
@@ -640,85 +1462,34 @@ class Roller(Frame):
             self.die_faces.set(sides - 1)
             sides -= 1
 
-        mod      = self.modifier .get()
-        fmod     = self.finalmod .get()
-        max_roll = sides
-        min_roll = 1
-        results  = []
-
-        if self.group.mainframe.use_random_org.get():
-            url = 'https://www.random.org/integers/?col={0}&num={0}&min={1}&max={2}&base=10&format=plain&rnd=new'
-            url = url.format(rolls, min_roll, max_roll)
-            try:
-                resp = urlopen(url)
-                results.extend([int(x) for x in str(resp.read().rstrip(), encoding='utf8').split('\t')])
-                sleep(0.1)
-            except:
-                print('Failed to use random.org, falling back to CSPRNG!')
+        return rolls, sides
 
+    def apply_roll(self, results, rolls, sides):
         if not results:
-            csprng = SystemRandom()
-            for i in range(rolls):
-                roll = csprng.randint(min_roll, sides)
-                results.append(roll)
-
-        self.results = []
-        for n in results:
-            if n == max_roll:
-                self.results.append(n * CRIT)
-            elif n == min_roll:
-                self.results.append(n * FAIL)
-            else:
-                self.results.append(n)
+            results = draw_dice(rolls, sides)
 
+        self.dice = engine.Dice.rolled(results, sides) if sides else results
         self.apply_modifiers(True)
 
-        self.history.append(self.create_hist_record())
-        hist_index = len(self.history) - 1
-        if single:
-            for roller in self.group.rollers:
-                if roller is not self:
-                    roller.history.append(roller.create_hist_record())
-            self.group.navigate_history(desired_index=hist_index)
-
-        self.group.hist_index = hist_index
-        self.name.set(self.name.get())
-
-        self.group.mainframe.editmenu.entryconfigure(
-            self.group.mainframe.editmenu.index('end'), command=lambda: self.roll(single=single))
-        self.group.mainframe.bind_all('<Control-r>', lambda e: self.roll(single=single))
-
     def apply_modifiers(self, rolling=False):
         fmod = self.finalmod.get()
         dmod = self.modifier.get()
-        dqty = self.dice_qty.get()
-
-        formatted_results = []
-        total = 0
-        for n in self.results:
-            if n > CRIT:
-                n = int(n / CRIT)
-                n = n + dmod
-                formatted_results.append('\u25b2{}'.format(str(n)))
-            elif 0 < n < 1:
-                n = int(n / FAIL)
-                n = n + dmod
-                formatted_results.append('\u25bc{}'.format(str(n)))
-            else:
-                n = n + dmod
-                formatted_results.append(str(n))
-            total += n
 
-        s = ' + '.join(formatted_results)
-        s = '{} = {}'.format(total + fmod, s)
+        self.results_text.set(self.dice.text(dmod, fmod))
+
+        if not rolling and len(self.group.history):
+            changes = {'modifier': dmod, 'finalmod': fmod}
+            i = self.group.history.amend(self.group.hist_index, self.rid, changes)
+            if i is not None:
+                self.group.mainframe.record('amend', g=self.group.index, i=i, id=self.rid, v=changes)
 
-        if not rolling and self.history:
-            self.history[self.group.hist_index]['modifier'    ] = dmod
-            self.history[self.group.hist_index]['finalmod'    ] = fmod
-            self.history[self.group.hist_index]['results_text'] = s
+        self.maintain_result_width()
 
-        self.results_text.set(s)
-        self.group.maintain_result_widths()
+    def maintain_result_width(self):
+        w = min(len(self.results_text.get()), 80)
+        if w != self.result_width:
+            self.result_width = w
+            self.results_entry.config(width=w)
 
 
 if __name__ == '__main__':
@@ -728,12 +1499,15 @@ if __name__ == '__main__':
     root.iconphoto(root, icon)
 
     def on_closing():
+        main.saver.flush()
         title = root.title()
         if '*' in title:
             if askyesno('Unsaved changes!', 'There are unsaved changes!\r\nWould you like to quit anyway?'):
+                main.close()
                 root.destroy()
         else:
             if askyesno('Quit?', 'Really quit?'):
+                main.close()
                 root.destroy()
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
@@ -0,0 +1,203 @@
+from mmap    import mmap, ACCESS_WRITE
+from os      import makedirs
+from os.path import getsize, isfile, join
+from shutil  import copyfile
+from struct  import Struct
+from uuid    import uuid4
+
+
+EVENT      = Struct('<qI'    )
+ENTRY      = Struct('<HBBbbI')
+DIE        = Struct('<H'     )
+CHECKPOINT = Struct('<II'    )
+PAIR       = Struct('<HI'    )
+PLAN       = Struct('<H'     )
+
+TABLES = (('events', EVENT), ('entries', ENTRY), ('dice', DIE), ('checkpoints', CHECKPOINT), ('pairs', PAIR),
+          ('plans', PLAN))
+
+CRIT_BIT = 1 << 14
+FAIL_BIT = 1 << 15
+
+
+def archive_dir(fpath):
+    return fpath + '.archive'
+
+
+class Table:
+    def __init__(self, fpath, record):
+        self.fpath  = fpath
+        self.record = record
+        if not isfile(fpath):
+            open(fpath, 'wb').close()
+        self.file  = open(fpath, 'r+b')
+        self.count = getsize(fpath) // record.size
+        self.map   = None
+        self.remap()
+
+    def __len__(self):
+        return self.count
+
+    def remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap(self.file.fileno(), 0, access=ACCESS_WRITE) if self.count else None
+
+    def get(self, i):
+        return self.record.unpack_from(self.map, i * self.record.size)
+
+    def put(self, i, *values):
+        self.record.pack_into(self.map, i * self.record.size, *values)
+
+    def extend(self, data):
+        if not data:
+            return
+        self.file.seek(self.count * self.record.size)
+        self.file.write(data)
+        self.file.flush()
+        self.count += len(data) // self.record.size
+        self.remap()
+
+    def truncate(self, count):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(count * self.record.size)
+        self.count = count
+        self.remap()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class HistoryArchive:
+    def __init__(self, directory, key=None, next_rid=0, expressions=None):
+        self.directory   = directory
+        self.key         = key or uuid4().hex[:12]
+        self.next_rid    = next_rid
+        self.expressions = expressions or ['']
+        self.amends      = {}
+        makedirs(directory, exist_ok=True)
+        self.tables = {name: Table(self.path(name), record) for name, record in TABLES}
+
+    @classmethod
+    def open(cls, directory, ref):
+        if not all(isfile(join(directory, '{}.{}'.format(ref['key'], name))) for name, record in TABLES[:-1]):
+            raise ValueError('History archive {} is missing from {}'.format(ref['key'], directory))
+        archive = cls(directory, ref['key'], ref.get('rids', 0), ref.get('expressions'))
+        plans   = archive.tables['plans']
+        if len(plans) < ref['entries']:
+            plans.extend(bytes(PLAN.size * (ref['entries'] - len(plans))))
+        archive.truncate(ref['events'], ref['entries'], ref['values'], ref['checkpoints'])
+        return archive
+
+    def path(self, name):
+        return join(self.directory, '{}.{}'.format(self.key, name))
+
+    @property
+    def events(self):
+        return len(self.tables['events'])
+
+    @property
+    def entries(self):
+        return len(self.tables['entries'])
+
+    @property
+    def values(self):
+        return len(self.tables['dice'])
+
+    @property
+    def checkpoints(self):
+        return len(self.tables['checkpoints'])
+
+    def ref(self):
+        return {'key'        : self.key        ,
+                'events'     : self.events     ,
+                'entries'    : self.entries    ,
+                'values'     : self.values     ,
+                'checkpoints': self.checkpoints,
+                'rids'       : self.next_rid   ,
+                'expressions': list(self.expressions)}
+
+    def truncate(self, events, entries, values, checkpoints):
+        tables = self.tables
+        if (events > self.events or entries > self.entries or values > self.values or
+                checkpoints > self.checkpoints):
+            raise ValueError('History archive {} is shorter than its reference'.format(self.key))
+        pairs = sum(tables['checkpoints'].get(checkpoints - 1)) if checkpoints else 0
+        tables['events'     ].truncate(events     )
+        tables['entries'    ].truncate(entries    )
+        tables['dice'       ].truncate(values     )
+        tables['checkpoints'].truncate(checkpoints)
+        tables['pairs'      ].truncate(pairs      )
+        tables['plans'      ].truncate(entries    )
+        self.amends = {j: mods for j, mods in self.amends.items() if j < entries}
+
+    def event(self, i):
+        return self.tables['events'].get(i)
+
+    def entry(self, j):
+        entry = self.tables['entries'].get(j)
+        if j in self.amends:
+            return entry[:3] + self.amends[j] + entry[5:]
+        return entry
+
+    def plan(self, j):
+        return self.tables['plans'].get(j)[0]
+
+    def set_modifiers(self, j, modifier, finalmod):
+        self.amends[j] = (modifier, finalmod)
+
+    def flush(self):
+        entries = self.tables['entries']
+        for j, (modifier, finalmod) in self.amends.items():
+            rid, qty, faces, old_modifier, old_finalmod, start = entries.get(j)
+            entries.put(j, rid, qty, faces, modifier, finalmod, start)
+        self.amends = {}
+
+    def dice(self, start, stop):
+        table  = self.tables['dice']
+        values = []
+        flags  = bytearray()
+        for n, in DIE.iter_unpack(table.map[start * DIE.size:stop * DIE.size]):
+            values.append(n & (CRIT_BIT - 1))
+            flags .append(1 if n & CRIT_BIT else 2 if n & FAIL_BIT else 0)
+        return values, bytes(flags)
+
+    def checkpoint(self, c):
+        start, count = self.tables['checkpoints'].get(c)
+        pairs = self.tables['pairs']
+        return dict(pairs.get(k) for k in range(start, start + count))
+
+    def append(self, events, entries, dice, checkpoints, plans):
+        pairs = []
+        index = []
+        start = len(self.tables['pairs'])
+        for state in checkpoints:
+            index.append(CHECKPOINT.pack(start, len(state)))
+            pairs.extend(PAIR.pack(rid, j) for rid, j in state.items())
+            start += len(state)
+        self.tables['events'     ].extend(b''.join(EVENT.pack(*e) for e in events ))
+        self.tables['entries'    ].extend(b''.join(ENTRY.pack(*e) for e in entries))
+        self.tables['dice'       ].extend(b''.join(DIE  .pack(n ) for n in dice   ))
+        self.tables['checkpoints'].extend(b''.join(index))
+        self.tables['pairs'      ].extend(b''.join(pairs))
+        self.tables['plans'      ].extend(b''.join(PLAN.pack(p) for p in plans))
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def relocate(self, directory):
+        if directory == self.directory:
+            return
+        makedirs(directory, exist_ok=True)
+        self.close()
+        for name, record in TABLES:
+            copyfile(self.path(name), join(directory, '{}.{}'.format(self.key, name)))
+        self.directory = directory
+        self.tables    = {name: Table(self.path(name), record) for name, record in TABLES}
+
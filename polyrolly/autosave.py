@@ -0,0 +1,65 @@
+from collections        import deque
+from concurrent.futures import ThreadPoolExecutor
+from time               import perf_counter
+
+
+DEBOUNCE = 500
+
+
+class SaveScheduler:
+    def __init__(self, schedule, cancel, debounce=DEBOUNCE):
+        self.schedule  = schedule
+        self.cancel    = cancel
+        self.debounce  = debounce
+        self.writer    = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autosave')
+        self.prepare   = None
+        self.timer     = None
+        self.requests  = 0
+        self.saves     = 0
+        self.coalesced = 0
+        self.failures  = 0
+        self.durations = deque(maxlen=100)
+
+    @property
+    def dirty(self):
+        return self.timer is not None
+
+    def request(self, prepare):
+        self.requests += 1
+        self.prepare   = prepare
+        if self.timer is None:
+            self.timer = self.schedule(self.debounce, self.fire)
+        else:
+            self.coalesced += 1
+
+    def fire(self):
+        self.timer = None
+        prepare, self.prepare = self.prepare, None
+        if prepare is not None:
+            self.submit(prepare())
+
+    def submit(self, write):
+        if write is not None:
+            return self.writer.submit(self.run, write)
+
+    def run(self, write):
+        start = perf_counter()
+        try:
+            write()
+        except Exception as e:
+            self.failures += 1
+            print('Autosave failed: {}'.format(e))
+            return
+        self.saves += 1
+        self.durations.append(perf_counter() - start)
+
+    def flush(self):
+        if self.timer is not None:
+            self.cancel(self.timer)
+            self.fire()
+        self.writer.submit(lambda: None).result()
+
+    def summary(self):
+        last = self.durations[-1] * 1000 if self.durations else 0.0
+        return '{} requests, {} saves, {} coalesced, {} failed, last {:.1f} ms'.format(
+            self.requests, self.saves, self.coalesced, self.failures, last)
@@ -0,0 +1,142 @@
+import numpy as np
+
+from polyrolly        import expression
+from polyrolly.engine import GroupConfig
+
+
+EXPLODE_DEPTH = 100
+
+
+class BulkResult:
+    __slots__ = ('config', 'dice', 'totals', 'crits', 'fails', 'draws')
+
+    def __init__(self, config, dice, totals, crits, fails, draws=None):
+        self.config = config
+        self.dice   = dice
+        self.totals = totals
+        self.crits  = crits
+        self.fails  = fails
+        self.draws  = draws
+
+    def __len__(self):
+        return len(self.totals)
+
+    def summary(self):
+        dice = max(1, self.draws if self.draws is not None else len(self.totals) * self.config.dice_qty)
+        return {'trials'   : len(self.totals)               ,
+                'mean'     : float(self.totals.mean())      ,
+                'std'      : float(self.totals.std())       ,
+                'min'      : int  (self.totals.min())       ,
+                'max'      : int  (self.totals.max())       ,
+                'crit_rate': float(self.crits.sum()) / dice ,
+                'fail_rate': float(self.fails.sum()) / dice }
+
+
+class GroupBulkResult:
+    __slots__ = ('config', 'rollers', 'totals')
+
+    def __init__(self, config, rollers):
+        self.config  = config
+        self.rollers = rollers
+        self.totals  = np.sum([r.totals for r in rollers], axis=0) if rollers else np.zeros(0, np.int32)
+
+    def __len__(self):
+        return len(self.totals)
+
+
+def generator(seed=None):
+    return np.random.default_rng(seed)
+
+
+def roll_roller(config, trials, rng, keep_dice=True):
+    faces = config.die_faces
+    raw   = rng.integers(1, faces + 1, size=(trials, config.dice_qty), dtype=np.int16)
+
+    crits  = np.count_nonzero(raw == faces, axis=1)
+    fails  = np.count_nonzero(raw == 1    , axis=1)
+    totals = raw.sum(axis=1, dtype=np.int32)
+    totals += config.dice_qty * config.modifier + config.finalmod
+
+    dice = None
+    if keep_dice:
+        dice  = raw
+        dice += config.modifier
+
+    return BulkResult(config, dice, totals, crits, fails)
+
+
+def roll_pool(term, trials, rng):
+    faces = term.faces
+    raw   = rng.integers(1, faces + 1, size=(trials, term.qty), dtype=np.int16)
+    if term.reroll is not None:
+        low, high = term.reroll
+        for i in range(1 if term.once else expression.MAX_REROLLS):
+            mask = (raw >= low) & (raw <= high)
+            n    = np.count_nonzero(mask)
+            if not n:
+                break
+            raw[mask] = rng.integers(1, faces + 1, size=n, dtype=np.int16)
+
+    if term.explode is None:
+        return raw
+    low, high = term.explode
+    columns   = [raw]
+    last      = raw
+    for i in range(EXPLODE_DEPTH):
+        alive = (last >= low) & (last <= high)
+        n     = np.count_nonzero(alive)
+        if not n:
+            break
+        last = np.zeros_like(raw)
+        last[alive] = rng.integers(1, faces + 1, size=n, dtype=np.int16)
+        columns.append(last)
+    return np.concatenate(columns, axis=1)
+
+
+def kept_mask(term, pool):
+    valid = pool > 0
+    if term.keep is None:
+        return valid
+    mode, k = term.keep
+    count   = np.count_nonzero(valid, axis=1)[:, None]
+    order   = np.argsort(np.where(valid, pool, np.iinfo(pool.dtype).max), axis=1, kind='stable')
+    rank    = np.argsort(order, axis=1)
+    if mode == 'kh':
+        keep = rank >= count - k
+    elif mode == 'kl':
+        keep = rank < k
+    elif mode == 'dh':
+        keep = rank < count - k
+    else:
+        keep = rank >= k
+    return valid & keep
+
+
+def roll_expression(config, trials, rng):
+    plan   = expression.compiled(config.expression)
+    totals = np.full(trials, plan.constant + config.finalmod, dtype=np.int32)
+    crits  = np.zeros(trials, dtype=np.int32)
+    fails  = np.zeros(trials, dtype=np.int32)
+    draws  = 0
+    for term in plan.terms:
+        pool  = roll_pool(term, trials, rng)
+        kept  = kept_mask(term, pool)
+        draws += np.count_nonzero(pool)
+        crits += np.count_nonzero(pool == term.faces, axis=1)
+        fails += np.count_nonzero(pool == 1         , axis=1)
+        if term.target is not None:
+            low, high = term.target
+            totals += term.sign * np.count_nonzero(kept & (pool >= low) & (pool <= high), axis=1)
+        else:
+            totals += term.sign * (np.where(kept, pool, 0).sum(axis=1, dtype=np.int32) +
+                                   np.count_nonzero(kept, axis=1) * config.modifier)
+    return BulkResult(config, None, totals, crits, fails, int(draws))
+
+
+def roll(config, trials, seed=None, rng=None, keep_dice=True):
+    rng = rng or generator(seed)
+    if isinstance(config, GroupConfig):
+        return GroupBulkResult(config, [roll(r, trials, rng=rng, keep_dice=keep_dice) for r in config.rollers])
+    if config.expression:
+        return roll_expression(config, trials, rng)
+    return roll_roller(config, trials, rng, keep_dice)
@@ -0,0 +1,137 @@
+from json import dumps
+from sys  import argv, stderr, stdout
+
+from polyrolly import engine, journal, rng
+
+
+BATCH_SIZE = 256
+
+ROLL_OPTIONS = {'config': '', 'group': [], 'times': 1, 'text': False, 'rng': 'system', 'seed': -1}
+
+USAGE = '''Usage: poly-rolly roll --config FILE [--group NAME]... [--times N] [--text]
+                        [--rng system|seeded|random.org] [--seed N]
+       poly-rolly serve FILE... [--host HOST] [--port N] [--save]'''
+
+
+def load_groups(fpath):
+    try:
+        snapshot = journal.load(fpath)[0]
+    except ValueError:
+        from polyrolly import container
+        snapshot = container.read(fpath)
+    snapshot.pop('settings', None)
+    return sorted((engine.GroupConfig.from_dict(name, group) for name, group in snapshot.items()),
+                  key=lambda group: group.index)
+
+
+def result_line(group, n, result, text=False):
+    rollers = []
+    for config, roll in zip(group.rollers, result.results):
+        line = {'name': config.name, 'total': roll.total, 'values': roll.values}
+        if text:
+            line['text'] = roll.text
+        rollers.append(line)
+    return dumps({'group': group.name, 'roll': n, 'total': result.total, 'rollers': rollers}, separators=(',', ':'))
+
+
+def pick_source(name, seed=-1):
+    if seed >= 0:
+        name = 'seeded'
+        rng.seeded.reseed(seed)
+    elif name == 'seeded':
+        print('Seed {}'.format(rng.seeded.seed), file=stderr)
+    source = rng.get(name)
+    if name == 'random.org':
+        source.wait_for(source.low_water, 10)
+    return source
+
+
+def parse_options(args, defaults):
+    options    = dict(defaults)
+    positional = []
+    args       = iter(args)
+    for arg in args:
+        if not arg.startswith('--'):
+            positional.append(arg)
+            continue
+        key, sep, value = arg[2:].partition('=')
+        if key not in defaults:
+            raise ValueError('Unknown option {}'.format(arg))
+        default = defaults[key]
+        if isinstance(default, bool):
+            options[key] = True
+            continue
+        if not sep:
+            value = next(args, None)
+        if value is None:
+            raise ValueError('--{} needs a value'.format(key))
+        if isinstance(default, list):
+            options[key] = options[key] + [value]
+        elif isinstance(default, int):
+            options[key] = int(value)
+        else:
+            options[key] = value
+    return options, positional
+
+
+def parse_args(args):
+    command = args[0] if args else None
+    if command == 'roll':
+        options, positional = parse_options(args[1:], ROLL_OPTIONS)
+        if positional:
+            raise ValueError('Unexpected argument {}'.format(positional[0]))
+        if not options['config']:
+            raise ValueError('--config is required')
+        return roll, dict(options, source=pick_source(options.pop('rng'), options.pop('seed')))
+    if command == 'serve':
+        from polyrolly import server
+        options, positional = parse_options(args[1:], server.OPTIONS)
+        if not positional:
+            raise ValueError('serve needs at least one config file')
+        return server.serve, dict(options, files=positional)
+    raise ValueError('Unknown command {}'.format(command))
+
+
+def roll(config, group=(), times=1, text=False, source=None):
+    try:
+        groups = load_groups(config)
+    except (OSError, ValueError) as e:
+        print('Cannot load {}: {}'.format(config, e), file=stderr)
+        return 1
+
+    if group:
+        by_name = {g.name: g for g in groups}
+        missing = [name for name in group if name not in by_name]
+        if missing:
+            print('No such group: {}'.format(', '.join(missing)), file=stderr)
+            return 1
+        groups = [by_name[name] for name in group]
+
+    lines = []
+    try:
+        for n in range(times):
+            for g in groups:
+                lines.append(result_line(g, n, engine.roll(g, source=source)[0], text))
+            if len(lines) >= BATCH_SIZE:
+                stdout.write('\n'.join(lines) + '\n')
+                lines = []
+        if lines:
+            stdout.write('\n'.join(lines) + '\n')
+        stdout.flush()
+    except BrokenPipeError:
+        stderr.close()
+    return 0
+
+
+def main(args=None):
+    try:
+        run, options = parse_args(argv[1:] if args is None else args)
+    except ValueError as e:
+        print(e, file=stderr)
+        print(USAGE, file=stderr)
+        return 2
+    return run(**options)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
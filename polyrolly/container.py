@@ -0,0 +1,165 @@
+from json    import dumps, loads
+from os      import replace
+from os.path import isdir, splitext
+from shutil  import copytree
+from struct  import Struct
+from sys     import argv
+
+from polyrolly         import journal
+from polyrolly.archive import archive_dir
+from polyrolly.history import GroupHistory, events_from_rollers
+
+
+EXTENSION = '.prly'
+MAGIC     = b'PRLY'
+VERSION   = 3
+
+HEADER = Struct('<4sHH')
+LENGTH = Struct('<Q')
+
+
+class Section:
+    __slots__ = ('fpath', 'offset', 'length', 'events', 'time', 'data', 'version', 'archive')
+
+    def __init__(self, fpath, offset, length, events=0, time=0, data=None, version=VERSION):
+        self.fpath   = fpath
+        self.offset  = offset
+        self.length  = length
+        self.events  = events
+        self.time    = time
+        self.data    = data
+        self.version = version
+        self.archive = None
+
+    def raw(self):
+        if self.data is None:
+            with open(self.fpath, 'rb') as f:
+                f.seek(self.offset)
+                self.data = f.read(self.length)
+        return self.data
+
+    def history(self):
+        return GroupHistory.from_bytes(self.raw(), self.archive, self.version)
+
+    def current(self):
+        if self.version == VERSION:
+            return self.raw()
+        return self.history().to_bytes()
+
+
+def is_container(fpath):
+    if splitext(fpath)[1].lower() == EXTENSION:
+        return True
+    try:
+        with open(fpath, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def history_section(history, rids=None):
+    if isinstance(history, Section):
+        return history
+    return history.frozen(rids)
+
+
+def write(fpath, snapshot):
+    meta     = {}
+    sections = []
+    for name, group in snapshot.items():
+        if name == 'settings':
+            meta[name] = group
+            continue
+        section = group['history']
+        sections.append(section.current())
+        meta[name] = dict({k: v for k, v in group.items() if k != 'history'}, events=section.events, time=section.time)
+
+    header = dumps(meta, separators=(',', ':')).encode('utf-8')
+    temp   = fpath + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        f.write(LENGTH.pack(len(header)))
+        f.write(header)
+        for data in sections:
+            f.write(LENGTH.pack(len(data)))
+            f.write(data)
+    replace(temp, fpath)
+
+
+def read(fpath):
+    with open(fpath, 'rb') as f:
+        magic, version, flags = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a Poly Rolly container'.format(fpath))
+        if version > VERSION:
+            raise ValueError('Unsupported container version {}'.format(version))
+
+        length, = LENGTH.unpack(f.read(LENGTH.size))
+        snapshot = loads(f.read(length).decode('utf-8'))
+        offset   = f.tell()
+        for name, group in snapshot.items():
+            if name == 'settings':
+                continue
+            f.seek(offset)
+            length, = LENGTH.unpack(f.read(LENGTH.size))
+            offset += LENGTH.size
+            group['history'] = Section(fpath, offset, length, group.pop('events', 0), group.pop('time', 0),
+                                       version=version)
+            offset += length
+    return snapshot
+
+
+def load(fpath):
+    return read(fpath), 0
+
+
+def to_json(snapshot):
+    for name, group in snapshot.items():
+        if name != 'settings' and isinstance(group.get('history'), Section):
+            history = group['history'].history()
+            group['history'] = history.to_list()
+            if history.archive is None and history.events_base:
+                group['trimmed'] = history.events_base
+    return snapshot
+
+
+def to_container(snapshot):
+    for name, group in snapshot.items():
+        if name == 'settings':
+            continue
+        if 'history' in group:
+            events = group['history']
+        else:
+            rollers = journal.ordered(group['rollers'])
+            events  = events_from_rollers({s.get('id', s.get('index', r)): s.pop('history', [])
+                                           for r, (n, s) in enumerate(rollers)})
+        ref = group.get('archive')
+        if ref:
+            history = GroupHistory.from_list(events, bases=(ref['events'], ref['entries'], ref['values']),
+                                             expressions=ref.get('expressions'))
+        else:
+            history = GroupHistory.from_list(events, bases=(group.pop('trimmed', 0), 0, 0))
+        group['history'] = history_section(history)
+    return snapshot
+
+
+def convert(source, target):
+    if is_container(source):
+        snapshot = to_json(read(source))
+    else:
+        snapshot = journal.load(source)[0]
+
+    if is_container(target):
+        write(target, to_container(snapshot))
+    else:
+        journal.Journal(target).write_snapshot(snapshot)
+
+    if isdir(archive_dir(source)) and archive_dir(source) != archive_dir(target):
+        copytree(archive_dir(source), archive_dir(target), dirs_exist_ok=True)
+
+
+if __name__ == '__main__':
+    if len(argv) != 3:
+        print('Usage: python -m polyrolly.container SOURCE TARGET')
+    else:
+        convert(argv[1], argv[2])
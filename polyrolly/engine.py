@@ -0,0 +1,260 @@
+from polyrolly import expression, rng
+
+
+CRIT = 1
+FAIL = 2
+
+LEGACY_CRIT = 1000
+LEGACY_FAIL = .001
+
+MARKERS = ('', '\u25b2', '\u25bc')
+
+csprng = rng.system
+
+
+class Record:
+    __slots__ = ()
+
+    @property
+    def fields(self):
+        return self.__slots__
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                               ', '.join('{}={!r}'.format(k, getattr(self, k)) for k in self.fields))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.fields)
+
+
+class RollerConfig(Record):
+    __slots__ = ('name', 'dice_qty', 'die_faces', 'modifier', 'finalmod', 'index', 'expression')
+
+    def __init__(self, name='Roller 1', dice_qty=1, die_faces=10, modifier=0, finalmod=0, index=0, expression=''):
+        self.name       = name
+        self.dice_qty   = dice_qty
+        self.die_faces  = die_faces
+        self.modifier   = modifier
+        self.finalmod   = finalmod
+        self.index      = index
+        self.expression = expression
+
+    @classmethod
+    def from_dict(cls, name, settings):
+        return cls(name, **{k: settings[k] for k in cls.__slots__[1:] if k in settings})
+
+    def to_dict(self):
+        settings = {'index'    : self.index    ,
+                    'dice_qty' : self.dice_qty ,
+                    'die_faces': self.die_faces,
+                    'modifier' : self.modifier ,
+                    'finalmod' : self.finalmod }
+        if self.expression:
+            settings['expression'] = self.expression
+        return settings
+
+
+class GroupConfig(Record):
+    __slots__ = ('name', 'index', 'rollers')
+
+    def __init__(self, name='Group 1', index=0, rollers=None):
+        self.name    = name
+        self.index   = index
+        self.rollers = rollers if rollers is not None else []
+
+    @classmethod
+    def from_dict(cls, name, settings):
+        rollers = [RollerConfig.from_dict(n, s) for n, s in settings.get('rollers', {}).items()]
+        rollers.sort(key=lambda x: x.index)
+        return cls(name, settings.get('index', 0), rollers)
+
+
+class Dice(Record):
+    __slots__ = ('values', 'flags', 'raw_sum', 'crits', 'fails', 'rendered')
+
+    fields = ('values', 'flags')
+
+    def __init__(self, values, flags):
+        self.values   = values
+        self.flags    = flags
+        self.raw_sum  = sum(values)
+        self.crits    = flags.count(CRIT)
+        self.fails    = flags.count(FAIL)
+        self.rendered = None
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def rolled(cls, values, faces):
+        return cls(values, bytes(CRIT if n == faces else FAIL if n == 1 else 0 for n in values))
+
+    @classmethod
+    def blank(cls, qty):
+        return cls([0] * qty, bytes(qty))
+
+    @classmethod
+    def from_legacy(cls, results):
+        values, flags = [], bytearray()
+        for n in results:
+            if n > LEGACY_CRIT:
+                values.append(int(round(n / LEGACY_CRIT)))
+                flags .append(CRIT)
+            elif 0 < n < 1:
+                values.append(int(round(n / LEGACY_FAIL)))
+                flags .append(FAIL)
+            else:
+                values.append(int(n))
+                flags .append(0)
+        return cls(values, bytes(flags))
+
+    @classmethod
+    def from_record(cls, record):
+        if record.get('expression'):
+            return evaluate(record['expression'], record['values'])
+        if 'values' not in record:
+            return cls.from_legacy(record.get('results', ()))
+        if 'flags' in record:
+            return cls(record['values'], bytes(record['flags']))
+        return cls.rolled(record['values'], record['die_faces'])
+
+    def total(self, modifier=0, finalmod=0):
+        return self.raw_sum + modifier * len(self.values) + finalmod
+
+    def body(self, modifier=0):
+        if self.rendered is None or self.rendered[0] != modifier:
+            self.rendered = modifier, ' + '.join('{}{}'.format(MARKERS[f], n + modifier)
+                                                 for n, f in zip(self.values, self.flags))
+        return self.rendered[1]
+
+    def text(self, modifier=0, finalmod=0):
+        return '{} = {}'.format(self.total(modifier, finalmod), self.body(modifier))
+
+
+class Outcome(Dice):
+    __slots__ = ('states', 'segments', 'score', 'per_die', 'constant')
+
+    def __init__(self, values, states, segments, score, per_die, constant):
+        flags = bytearray(len(values))
+        for sign, start, stop, faces, pool in segments:
+            for k in range(start, stop):
+                n = values[k]
+                flags[k] = CRIT if n == faces else FAIL if n == 1 else 0
+        Dice.__init__(self, values, bytes(flags))
+        self.states   = states
+        self.segments = segments
+        self.score    = score
+        self.per_die  = per_die
+        self.constant = constant
+
+    def total(self, modifier=0, finalmod=0):
+        return self.score + modifier * self.per_die + finalmod
+
+    def body(self, modifier=0):
+        if self.rendered is None or self.rendered[0] != modifier:
+            values, flags, states = self.values, self.flags, self.states
+            parts = []
+            for sign, start, stop, faces, pool in self.segments:
+                shift = 0 if pool else modifier
+                dice  = ' + '.join(('({}{})' if states[k] else '{}{}').format(MARKERS[flags[k]], values[k] + shift)
+                                   for k in range(start, stop))
+                if stop - start > 1 and (len(self.segments) > 1 or self.constant):
+                    dice = '[{}]'.format(dice)
+                parts.append((sign, dice))
+            if self.constant:
+                parts.append((1 if self.constant > 0 else -1, str(abs(self.constant))))
+            text = ''
+            for sign, part in parts:
+                text += (' - ' if sign < 0 else ' + ') + part if text else ('-' if sign < 0 else '') + part
+            self.rendered = modifier, text
+        return self.rendered[1]
+
+
+class RollResult(Record):
+    __slots__ = ('dice_qty', 'die_faces', 'modifier', 'finalmod', 'dice')
+
+    def __init__(self, dice_qty, die_faces, modifier, finalmod, dice):
+        self.dice_qty  = dice_qty
+        self.die_faces = die_faces
+        self.modifier  = modifier
+        self.finalmod  = finalmod
+        self.dice      = dice
+
+    @property
+    def values(self):
+        return self.dice.values
+
+    @property
+    def total(self):
+        return self.dice.total(self.modifier, self.finalmod)
+
+    @property
+    def text(self):
+        return self.dice.text(self.modifier, self.finalmod)
+
+
+class GroupResult(Record):
+    __slots__ = ('name', 'results')
+
+    def __init__(self, name, results):
+        self.name    = name
+        self.results = results
+
+    @property
+    def total(self):
+        return sum(r.total for r in self.results)
+
+
+def draw(qty, faces, source=None):
+    source = source or csprng
+    if hasattr(source, 'integers'):
+        return source.integers(1, faces, qty)
+    return [source.randint(1, faces) for i in range(qty)]
+
+
+def evaluate(text, values):
+    draws = iter(values)
+    return Outcome(*expression.compiled(text).evaluate(lambda faces: next(draws, 1)))
+
+
+def draw_expression(text, source=None):
+    randint = (source or csprng).randint
+    return Outcome(*expression.compiled(text).evaluate(lambda faces: randint(1, faces)))
+
+
+def hist_record(config, dice):
+    if config.expression:
+        return {'dice_qty'  : len(dice.values)  ,
+                'die_faces' : 0                 ,
+                'modifier'  : config.modifier   ,
+                'finalmod'  : config.finalmod   ,
+                'values'    : list(dice.values) ,
+                'expression': config.expression }
+    return {'dice_qty' : config.dice_qty ,
+            'die_faces': config.die_faces,
+            'modifier' : config.modifier ,
+            'finalmod' : config.finalmod ,
+            'values'   : list(dice.values)}
+
+
+def make_result(config, values):
+    if config.expression:
+        dice = evaluate(config.expression, values)
+    else:
+        dice = Dice.rolled(values, config.die_faces)
+    return RollResult(config.dice_qty, config.die_faces, config.modifier, config.finalmod, dice)
+
+
+def roll_dice(config, source=None):
+    if config.expression:
+        return draw_expression(config.expression, source)
+    return Dice.rolled(draw(config.dice_qty, config.die_faces, source), config.die_faces)
+
+
+def roll(config, n=1, source=None):
+    if isinstance(config, GroupConfig):
+        return [GroupResult(config.name, [roll(r, source=source)[0] for r in config.rollers]) for i in range(n)]
+    return [RollResult(config.dice_qty, config.die_faces, config.modifier, config.finalmod, roll_dice(config, source))
+            for i in range(n)]
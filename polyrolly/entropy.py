@@ -0,0 +1,218 @@
+from collections    import deque
+from http.client    import HTTPConnection, HTTPSConnection, HTTPException
+from threading      import Condition, Lock, Thread
+from time           import perf_counter, sleep
+from urllib.parse   import urlsplit
+from urllib.request import urlopen
+
+from polyrolly import rng
+
+
+RANDOM_ORG_URL = 'https://www.random.org/integers/'
+BLOCK_RANGE    = 1 << 16
+BLOCK_SIZE     = 2000
+LOW_WATER      = 500
+MAX_PER_FETCH  = 10000
+
+
+def build_query(num, low, high):
+    return '?num={}&min={}&max={}&col=1&base=10&format=plain&rnd=new'.format(num, low, high)
+
+
+def parse_plain(body):
+    return [int(x) for x in str(body, encoding='utf8').split()]
+
+
+def fetch_block(url, num, low, high, timeout=10):
+    with urlopen(url + build_query(num, low, high), timeout=timeout) as resp:
+        return parse_plain(resp.read())
+
+
+def rejection_limit(span):
+    if span > BLOCK_RANGE:
+        raise ValueError('range of {} exceeds pool block range'.format(span))
+    return BLOCK_RANGE - BLOCK_RANGE % span
+
+
+class EntropyPool:
+    def __init__(self, url=RANDOM_ORG_URL, block_size=BLOCK_SIZE, low_water=LOW_WATER, pause=0.1):
+        self.url        = url
+        self.block_size = min(block_size, MAX_PER_FETCH)
+        self.low_water  = low_water
+        self.pause      = pause
+        self.buffer     = deque()
+        self.fallback   = rng.system
+        self.condition  = Condition()
+        self.thread     = None
+        self.wanted     = False
+        self.closed     = False
+        self.fetches    = 0
+        self.failures   = 0
+        self.served     = 0
+        self.fallbacks  = 0
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def start(self):
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.closed = False
+                self.thread = Thread(target=self.run, name='entropy-pool', daemon=True)
+                self.thread.start()
+            self.wanted = True
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not (self.wanted or len(self.buffer) < self.low_water):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                self.wanted = False
+
+            try:
+                block = fetch_block(self.url, self.block_size, 0, BLOCK_RANGE - 1)
+            except Exception:
+                self.failures += 1
+                print('Failed to refill entropy pool from random.org!')
+                sleep(min(30, self.pause * 10 * 2 ** min(self.failures, 8)))
+                continue
+
+            self.failures = 0
+            with self.condition:
+                self.buffer.extend(block)
+                self.fetches += 1
+                self.condition.notify_all()
+            sleep(self.pause)
+
+    def wait_for(self, count, timeout=None):
+        self.start()
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.buffer) >= count, timeout)
+
+    def randint(self, low, high):
+        span  = high - low + 1
+        limit = rejection_limit(span)
+
+        with self.condition:
+            while self.buffer:
+                value = self.buffer.popleft()
+                if value < limit:
+                    self.served += 1
+                    if len(self.buffer) < self.low_water:
+                        self.request_refill()
+                    return low + value % span
+            self.fallbacks += 1
+            self.request_refill()
+
+        return self.fallback.randint(low, high)
+
+    def request_refill(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        else:
+            self.wanted = True
+            self.condition.notify_all()
+
+    def randints(self, count, low, high):
+        return [self.randint(low, high) for i in range(count)]
+
+    def integers(self, low, high, size):
+        return self.randints(size, low, high)
+
+
+class RandomOrgClient:
+    def __init__(self, url=RANDOM_ORG_URL, timeout=10):
+        parts = urlsplit(url)
+
+        self.secure      = parts.scheme == 'https'
+        self.host        = parts.hostname
+        self.port        = parts.port
+        self.path        = parts.path or '/'
+        self.timeout     = timeout
+        self.connection  = None
+        self.lock        = Lock()
+        self.connects    = 0
+        self.requests    = 0
+        self.group_rolls = 0
+        self.rollers     = 0
+        self.latencies   = deque(maxlen=100)
+
+    @property
+    def requests_saved(self):
+        return self.rollers - self.requests
+
+    @property
+    def last_latency(self):
+        return self.latencies[-1] if self.latencies else 0.0
+
+    def connect(self):
+        connection_type = HTTPSConnection if self.secure else HTTPConnection
+        self.connection = connection_type(self.host, self.port, timeout=self.timeout)
+        self.connects  += 1
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def fetch(self, num, low, high):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connect()
+            try:
+                self.connection.request('GET', self.path + build_query(num, low, high),
+                                        headers={'Connection': 'keep-alive'})
+                resp = self.connection.getresponse()
+                body = resp.read()
+            except (HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+                continue
+            self.requests += 1
+            if resp.status != 200:
+                raise HTTPException('random.org replied {} {}'.format(resp.status, resp.reason))
+            if resp.will_close:
+                self.connection.close()
+                self.connection = None
+            return parse_plain(body)
+
+    def draw_group(self, specs):
+        start  = perf_counter()
+        total  = sum(qty for qty, faces in specs)
+        margin = total // 64 + 4
+        values = deque()
+        batch  = []
+
+        with self.lock:
+            values.extend(self.fetch(min(total + margin, MAX_PER_FETCH), 0, BLOCK_RANGE - 1))
+            for qty, faces in specs:
+                limit   = rejection_limit(faces)
+                results = []
+                while len(results) < qty:
+                    if not values:
+                        values.extend(self.fetch(min(margin, MAX_PER_FETCH), 0, BLOCK_RANGE - 1))
+                    value = values.popleft()
+                    if value < limit:
+                        results.append(1 + value % faces)
+                batch.append(results)
+
+            self.group_rolls += 1
+            self.rollers     += len(specs)
+            self.latencies.append(perf_counter() - start)
+
+        return batch
+
+    def summary(self):
+        return '{} group rolls, {} requests for {} rollers ({} saved), last {:.1f} ms'.format(
+            self.group_rolls, self.requests, self.rollers, self.requests_saved, self.last_latency * 1000)
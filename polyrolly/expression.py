@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from re          import compile as regex
+
+
+CACHE_SIZE  = 1024
+MAX_DRAWS   = 255
+MAX_FACES   = 1000
+MAX_REROLLS = 100
+
+KEPT     = 0
+DROPPED  = 1
+REROLLED = 2
+
+TOKEN = regex(r'\s*(?:(\d+)|(kh|kl|dh|dl|ro|k|r|!)|(d%|d)|(>=|<=|>|<|=)|([+-]))')
+
+plan_cache = OrderedDict()
+
+
+def compare(op, n, faces):
+    if op == '>=':
+        return n, faces
+    if op == '>':
+        return n + 1, faces
+    if op == '<=':
+        return 1, n
+    if op == '<':
+        return 1, n - 1
+    return n, n
+
+
+class DiceTerm:
+    __slots__ = ('sign', 'qty', 'faces', 'keep', 'explode', 'reroll', 'once', 'target', 'reserve')
+
+    def __init__(self, sign, qty, faces):
+        self.sign    = sign
+        self.qty     = qty
+        self.faces   = faces
+        self.keep    = None
+        self.explode = None
+        self.reroll  = None
+        self.once    = False
+        self.target  = None
+        self.reserve = 0
+
+    @property
+    def pool(self):
+        return self.target is not None
+
+    def roll(self, take, values, states):
+        faces = self.faces
+        pool  = []
+        for i in range(self.qty):
+            limit = MAX_DRAWS - self.reserve - (self.qty - i - 1)
+            n = take(faces)
+            values.append(n)
+            states.append(KEPT)
+            if self.reroll is not None:
+                low, high = self.reroll
+                tries     = 1 if self.once else MAX_REROLLS
+                while low <= n <= high and tries and len(values) < limit:
+                    states[-1] = REROLLED
+                    n = take(faces)
+                    values.append(n)
+                    states.append(KEPT)
+                    tries -= 1
+            pool.append(len(values) - 1)
+            if self.explode is not None:
+                low, high = self.explode
+                while low <= n <= high and len(values) < limit:
+                    n = take(faces)
+                    values.append(n)
+                    states.append(KEPT)
+                    pool.append(len(values) - 1)
+
+        if self.keep is not None:
+            mode, k = self.keep
+            ranked  = sorted(pool, key=values.__getitem__)
+            if mode == 'kh':
+                dropped = ranked[:max(0, len(ranked) - k)]
+            elif mode == 'kl':
+                dropped = ranked[k:]
+            elif mode == 'dh':
+                dropped = ranked[max(0, len(ranked) - k):]
+            else:
+                dropped = ranked[:k]
+            for j in dropped:
+                states[j] = DROPPED
+
+        score = kept = 0
+        if self.target is not None:
+            low, high = self.target
+            for j in pool:
+                if states[j] != KEPT:
+                    continue
+                if low <= values[j] <= high:
+                    score += 1
+                else:
+                    states[j] = DROPPED
+            return score, 0
+        for j in pool:
+            if states[j] == KEPT:
+                score += values[j]
+                kept  += 1
+        return score, kept
+
+
+class Plan:
+    __slots__ = ('text', 'terms', 'constant')
+
+    def __init__(self, text, terms, constant):
+        self.text     = text
+        self.terms    = terms
+        self.constant = constant
+
+    def evaluate(self, take):
+        values   = []
+        states   = bytearray()
+        segments = []
+        score    = self.constant
+        per_die  = 0
+        for term in self.terms:
+            start       = len(values)
+            total, kept = term.roll(take, values, states)
+            score      += term.sign * total
+            per_die    += term.sign * kept
+            segments.append((term.sign, start, len(values), term.faces, term.pool))
+        return values, states, segments, score, per_die, self.constant
+
+
+def parse(text):
+    source = text.replace(' ', '').lower()
+    tokens = []
+    pos    = 0
+    while pos < len(source):
+        match = TOKEN.match(source, pos)
+        if match is None or match.end() == pos:
+            raise ValueError('Invalid dice expression: {!r} at {!r}'.format(text, source[pos:]))
+        tokens.append((match.lastindex, match.group(match.lastindex)))
+        pos = match.end()
+    if not tokens:
+        raise ValueError('Empty dice expression')
+
+    terms    = []
+    constant = 0
+    sign     = 1
+    i        = 0
+
+    def peek(kind):
+        return i < len(tokens) and tokens[i][0] == kind
+
+    def number():
+        nonlocal i
+        if not peek(1):
+            raise ValueError('Invalid dice expression: {!r} expects a number'.format(text))
+        i += 1
+        return int(tokens[i - 1][1])
+
+    def threshold(faces):
+        nonlocal i
+        if peek(1):
+            return compare('=', number(), faces)
+        op = tokens[i][1]
+        i += 1
+        return compare(op, number(), faces)
+
+    if peek(5):
+        sign = -1 if tokens[0][1] == '-' else 1
+        i   += 1
+    while True:
+        qty = number() if peek(1) else None
+        if not peek(3):
+            if qty is None:
+                raise ValueError('Invalid dice expression: {!r}'.format(text))
+            constant += sign * qty
+        else:
+            faces = 100 if tokens[i][1] == 'd%' else None
+            i    += 1
+            if faces is None:
+                faces = number()
+            qty = 1 if qty is None else qty
+            if not 1 <= qty <= MAX_DRAWS or not 2 <= faces <= MAX_FACES:
+                raise ValueError('Invalid dice expression: {!r} is out of range'.format(text))
+            term = DiceTerm(sign, qty, faces)
+            while peek(2) or peek(4):
+                if peek(4):
+                    term.target = threshold(faces)
+                    continue
+                op = tokens[i][1]
+                i += 1
+                if op == '!':
+                    term.explode = threshold(faces) if peek(4) or peek(1) else (faces, faces)
+                    if term.explode[0] <= 1:
+                        raise ValueError('Invalid dice expression: {!r} explodes forever'.format(text))
+                elif op in ('r', 'ro'):
+                    term.reroll = threshold(faces) if peek(4) or peek(1) else (1, 1)
+                    term.once   = op == 'ro'
+                    if term.reroll[0] <= 1 and term.reroll[1] >= faces:
+                        raise ValueError('Invalid dice expression: {!r} rerolls forever'.format(text))
+                else:
+                    term.keep = ('kh' if op == 'k' else op), number()
+            terms.append(term)
+        if i == len(tokens):
+            break
+        if not peek(5):
+            raise ValueError('Invalid dice expression: {!r} at {!r}'.format(text, tokens[i][1]))
+        sign = -1 if tokens[i][1] == '-' else 1
+        i   += 1
+        if i == len(tokens):
+            raise ValueError('Invalid dice expression: {!r} ends with an operator'.format(text))
+
+    reserve = 0
+    for term in reversed(terms):
+        term.reserve = reserve
+        reserve     += term.qty
+    if reserve > MAX_DRAWS:
+        raise ValueError('Invalid dice expression: {!r} rolls too many dice'.format(text))
+    return Plan(source, tuple(terms), constant)
+
+
+def compiled(text):
+    plan = plan_cache.get(text)
+    if plan is not None:
+        plan_cache.move_to_end(text)
+        return plan
+    plan = plan_cache[text] = parse(text)
+    if len(plan_cache) > CACHE_SIZE:
+        plan_cache.popitem(last=False)
+    return plan
@@ -0,0 +1,539 @@
+from array    import array
+from datetime import datetime as dt
+from struct   import Struct
+from sys      import byteorder
+from time     import time
+
+from polyrolly         import engine
+from polyrolly.archive import CRIT_BIT, FAIL_BIT, HistoryArchive
+from polyrolly.stats   import RunningStats
+
+
+CHECKPOINT_EVERY = 32
+RECENT_EVENTS    = 1024
+SPILL_EVENTS     = 256
+ROLLUP_SECONDS   = 3600
+
+RECORD_KEYS = ('dice_qty', 'die_faces', 'modifier', 'finalmod', 'values', 'flags', 'results', 'expression')
+
+COLUMNS = ('stamps', 'first', 'rids', 'dice_qty', 'die_faces', 'modifier', 'finalmod', 'start', 'plans', 'values')
+COUNTS  = Struct('<IIII')
+BASES   = Struct('<QQQ')
+TABLE   = Struct('<I')
+
+ENTRY_COLUMNS = ('rids', 'dice_qty', 'die_faces', 'modifier', 'finalmod', 'start')
+
+
+def now():
+    return int(time())
+
+
+def format_stamp(stamp):
+    return dt.fromtimestamp(stamp).strftime('%H:%M:%S')
+
+
+def format_hour(stamp):
+    return dt.fromtimestamp(stamp).strftime('%m-%d %H:00')
+
+
+def parse_stamp(event):
+    if 'time' in event:
+        return int(event['time'])
+    try:
+        clock = dt.strptime(event.get('timestamp', ''), '%H:%M:%S').time()
+    except ValueError:
+        return 0
+    return int(dt.combine(dt.now().date(), clock).timestamp())
+
+
+class FlagBits:
+    def __init__(self):
+        self.bits = bytearray()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, crit, fail):
+        i = self.size * 2
+        if i % 8 == 0:
+            self.bits.append(0)
+        self.bits[i >> 3] |= (crit | fail << 1) << (i & 7)
+        self.size += 1
+
+    def get(self, n):
+        i = n * 2
+        b = self.bits[i >> 3] >> (i & 7)
+        return b & 1, b >> 1 & 1
+
+    def prefix(self, size):
+        flags      = FlagBits()
+        flags.bits = self.bits[:(size * 2 + 7) // 8]
+        flags.size = size
+        if size * 2 & 7:
+            flags.bits[-1] &= (1 << (size * 2 & 7)) - 1
+        return flags
+
+
+class GroupHistory:
+    def __init__(self, checkpoint_every=CHECKPOINT_EVERY, archive_dir=None):
+        self.checkpoint_every = checkpoint_every
+        self.archive_dir      = archive_dir
+        self.archive          = None
+        self.keep             = None
+        self.archive_old      = True
+        self.clear()
+
+    def __len__(self):
+        return self.events_base + len(self.stamps)
+
+    def clear(self):
+        if self.archive is not None:
+            self.archive.close()
+        self.archive      = None
+        self.events_base  = 0
+        self.entries_base = 0
+        self.values_base  = 0
+        self.stamps      = array('q')
+        self.first       = array('I')
+        self.rids        = array('H')
+        self.dice_qty    = array('B')
+        self.die_faces   = array('B')
+        self.modifier    = array('b')
+        self.finalmod    = array('b')
+        self.start       = array('I')
+        self.plans       = array('H')
+        self.values      = array('h')
+        self.flags       = FlagBits()
+        self.expressions = ['']
+        self.plan_ids    = {'': 0}
+        self.checkpoints = []
+        self.latest      = {}
+        self.cached      = None
+        self.rollups     = {}
+        self.carried     = {}
+
+    @property
+    def oldest(self):
+        return 0 if self.archive is not None else self.events_base
+
+    @property
+    def bases(self):
+        return self.events_base, self.entries_base, self.values_base
+
+    def attach(self, archive, bases=None, expressions=None):
+        self.archive = archive
+        if archive is not None:
+            bases       = archive.events, archive.entries, archive.values
+            expressions = archive.expressions
+        if bases:
+            self.events_base, self.entries_base, self.values_base = bases
+        if expressions is not None:
+            self.expressions = expressions
+            self.plan_ids    = {text: i for i, text in enumerate(expressions)}
+        self.latest = self.entry_state(self.events_base - 1) if archive is not None and self.events_base else {}
+        self.cached = None
+
+    def entry_count(self):
+        return self.entries_base + len(self.rids)
+
+    def plan_id(self, text):
+        i = self.plan_ids.get(text)
+        if i is None:
+            i = self.plan_ids[text] = len(self.expressions)
+            self.expressions.append(text)
+        return i
+
+    def append_entry(self, rid, record):
+        self.rids     .append(rid)
+        self.dice_qty .append(record['dice_qty' ])
+        self.die_faces.append(record['die_faces'])
+        self.modifier .append(record['modifier' ])
+        self.finalmod .append(record['finalmod' ])
+        self.start    .append(self.values_base + len(self.values))
+        self.plans    .append(self.plan_id(record.get('expression', '')))
+        dice = engine.Dice.from_record(record)
+        self.values.extend(dice.values)
+        for f in dice.flags:
+            self.flags.append(f == engine.CRIT, f == engine.FAIL)
+        return self.entry_count() - 1
+
+    def append(self, stamp, rolls):
+        self.stamps.append(stamp)
+        self.first .append(self.entry_count())
+        for rid, record in rolls.items():
+            self.latest[rid] = self.append_entry(rid, record)
+        if (len(self) - 1) % self.checkpoint_every == 0:
+            self.checkpoints.append(dict(self.latest))
+        if self.keep is not None:
+            if len(self.stamps) >= self.keep + self.checkpoint_every:
+                self.spill(self.keep)
+        elif self.archive_dir is not None and len(self.stamps) >= RECENT_EVENTS + SPILL_EVENTS:
+            self.spill()
+        return len(self) - 1
+
+    def retain(self, policy):
+        policy           = policy or {}
+        self.keep        = policy.get('keep') or None
+        self.archive_old = policy.get('archive', True)
+        if self.keep is None:
+            return
+        if not self.archive_old and self.archive is not None:
+            self.roll_up(self.events_base)
+            self.carry(self.entries_base, self.checkpoints[0] if self.checkpoints else self.latest)
+            self.archive.close()
+            self.archive = None
+            self.prune()
+        if len(self.stamps) >= self.keep + self.checkpoint_every:
+            self.spill(self.keep)
+
+    def rolled_up(self):
+        return sum(rollup['events'] for rollup in self.rollups.values())
+
+    def roll_up(self, stop):
+        for i in range(max(self.rolled_up(), self.oldest), stop):
+            hour   = self.time(i) // ROLLUP_SECONDS * ROLLUP_SECONDS
+            rollup = self.rollups.get(hour)
+            if rollup is None:
+                rollup = self.rollups[hour] = {'events': 0, 'rollers': {}}
+            rollup['events'] += 1
+            for j in self.entries(i):
+                rid, qty, faces, modifier, finalmod = self.entry(j)[:5]
+                stats = rollup['rollers'].get(rid)
+                if stats is None:
+                    stats = rollup['rollers'][rid] = RunningStats()
+                dice = self.dice(j)
+                stats.add(dice.total(modifier, finalmod), dice, faces)
+
+    def rollups_to_dict(self):
+        return {str(hour): {'events' : rollup['events'],
+                            'rollers': {str(rid): stats.to_dict() for rid, stats in rollup['rollers'].items()}}
+                for hour, rollup in sorted(self.rollups.items())}
+
+    def load_rollups(self, data):
+        self.rollups = {int(hour): {'events' : rollup['events'],
+                                    'rollers': {int(rid): RunningStats.from_dict(stats)
+                                                for rid, stats in rollup['rollers'].items()}}
+                        for hour, rollup in (data or {}).items()}
+
+    def carried_to_dict(self):
+        return {str(rid): record for rid, record in self.carried.items()}
+
+    def load_carried(self, data):
+        self.carried = {int(rid): record for rid, record in (data or {}).items()}
+
+    def carry(self, boundary, state):
+        for rid, j in state.items():
+            if j < boundary:
+                self.carried[rid] = self.record(j)
+
+    def prune(self):
+        for state in self.checkpoints + [self.latest]:
+            for rid in [rid for rid, j in state.items() if j < self.entries_base]:
+                del state[rid]
+        self.cached = None
+
+    def spill(self, recent=RECENT_EVENTS):
+        n = (len(self.stamps) - recent) // self.checkpoint_every * self.checkpoint_every
+        if n <= 0:
+            return
+        if self.keep is not None:
+            self.roll_up(self.events_base + n)
+        entries = self.first[n] - self.entries_base
+        values  = self.start[entries] - self.values_base if entries < len(self.rids) else len(self.values)
+        if self.archive_dir is not None and self.archive_old:
+            if self.archive is None:
+                self.archive = HistoryArchive(self.archive_dir())
+                self.archive.expressions = self.expressions
+            dice = []
+            for k in range(values):
+                crit, fail = self.flags.get(k)
+                dice.append(self.values[k] | crit * CRIT_BIT | fail * FAIL_BIT)
+            self.archive.next_rid = max([self.archive.next_rid] + [rid + 1 for rid in self.rids[:entries]])
+            self.archive.append(zip(self.stamps[:n], self.first[:n]),
+                                zip(*(getattr(self, name)[:entries] for name in ENTRY_COLUMNS)),
+                                dice,
+                                self.checkpoints[:n // self.checkpoint_every],
+                                self.plans[:entries])
+        else:
+            self.carry(self.entries_base + entries, self.checkpoints[n // self.checkpoint_every])
+
+        for name in ('stamps', 'first'):
+            setattr(self, name, getattr(self, name)[n:])
+        for name in ENTRY_COLUMNS + ('plans',):
+            setattr(self, name, getattr(self, name)[entries:])
+        flags = FlagBits()
+        for k in range(values, len(self.values)):
+            flags.append(*self.flags.get(k))
+        self.values        = self.values[values:]
+        self.checkpoints   = self.checkpoints[n // self.checkpoint_every:]
+        self.flags         = flags
+        self.events_base  += n
+        self.entries_base += entries
+        self.values_base  += values
+        if self.archive is None:
+            self.prune()
+
+    def index_checkpoints(self):
+        self.checkpoints = []
+        self.attach(self.archive, self.bases)
+        for i in range(self.events_base, len(self)):
+            for j in self.entries(i):
+                self.latest[self.rid(j)] = j
+            if i % self.checkpoint_every == 0:
+                self.checkpoints.append(dict(self.latest))
+
+    def time(self, index):
+        if index < self.events_base:
+            return self.archive.event(index)[0]
+        return self.stamps[index - self.events_base]
+
+    def timestamp(self, index):
+        return format_stamp(self.time(index))
+
+    def label(self, index):
+        if index and index == self.oldest:
+            return '\u2026 ' + self.timestamp(index)
+        return self.timestamp(index)
+
+    def first_entry(self, index):
+        if index < self.events_base:
+            return self.archive.event(index)[1]
+        return self.first[index - self.events_base]
+
+    def entries(self, index):
+        end = self.first_entry(index + 1) if index + 1 < len(self) else self.entry_count()
+        return range(self.first_entry(index), end)
+
+    def event_of(self, j):
+        lo, hi = self.oldest, len(self) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.first_entry(mid) <= j:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def entry(self, j):
+        if j < self.entries_base:
+            return self.archive.entry(j)
+        k = j - self.entries_base
+        return tuple(getattr(self, name)[k] for name in ENTRY_COLUMNS)
+
+    def rid(self, j):
+        if j < self.entries_base:
+            return self.archive.entry(j)[0]
+        return self.rids[j - self.entries_base]
+
+    def checkpoint(self, c):
+        base = self.events_base // self.checkpoint_every
+        if c < base:
+            return self.archive.checkpoint(c)
+        return self.checkpoints[c - base]
+
+    def entry_state(self, index):
+        if self.cached is not None and self.cached[0] == index:
+            return self.cached[1]
+        c     = index // self.checkpoint_every
+        state = dict(self.checkpoint(c))
+        for j in range(self.entries(c * self.checkpoint_every).stop, self.entries(index).stop):
+            state[self.rid(j)] = j
+        self.cached = index, state
+        return state
+
+    def plan(self, j):
+        if j < self.entries_base:
+            return self.archive.plan(j)
+        return self.plans[j - self.entries_base]
+
+    def dice(self, j):
+        rid, qty, faces, modifier, finalmod, start = self.entry(j)
+        plan = self.plan(j)
+        if plan:
+            return engine.evaluate(self.expressions[plan], self.record(j)['values'])
+        if j < self.entries_base:
+            return engine.Dice(*self.archive.dice(start, start + qty))
+        start -= self.values_base
+        flags  = bytearray()
+        for k in range(start, start + qty):
+            crit, fail = self.flags.get(k)
+            flags.append(engine.CRIT if crit else engine.FAIL if fail else 0)
+        return engine.Dice(self.values[start:start + qty].tolist(), bytes(flags))
+
+    def record(self, j):
+        rid, qty, faces, modifier, finalmod, start = self.entry(j)
+        if j < self.entries_base:
+            values = self.archive.dice(start, start + qty)[0]
+        else:
+            values = self.values[start - self.values_base:start - self.values_base + qty].tolist()
+        record = {'dice_qty' : qty     ,
+                  'die_faces': faces   ,
+                  'modifier' : modifier,
+                  'finalmod' : finalmod,
+                  'values'   : values  }
+        plan = self.plan(j)
+        if plan:
+            record['expression'] = self.expressions[plan]
+        return record
+
+    def render(self, j):
+        return self.render_record(self.record(j), self.dice(j))
+
+    @staticmethod
+    def render_record(record, dice):
+        record['dice'] = dice
+        record['results_text'] = dice.text(record['modifier'], record['finalmod'])
+        if 'expression' in record:
+            del record['dice_qty'], record['die_faces']
+        else:
+            record['expression'] = ''
+        return record
+
+    def state_at(self, index, rids=None):
+        state = {rid: self.render_record(dict(record), engine.Dice.from_record(record))
+                 for rid, record in self.carried.items() if rids is None or rid in rids}
+        state.update((rid, self.render(j)) for rid, j in self.entry_state(index).items() if rids is None or rid in rids)
+        return state
+
+    def amend(self, index, rid, changes):
+        j = self.entry_state(index).get(rid)
+        if j is None:
+            return None
+        modifier, finalmod = self.entry(j)[3:5]
+        if changes['modifier'] == modifier and changes['finalmod'] == finalmod:
+            return None
+        if j < self.entries_base:
+            self.archive.set_modifiers(j, changes['modifier'], changes['finalmod'])
+        else:
+            self.modifier[j - self.entries_base] = changes['modifier']
+            self.finalmod[j - self.entries_base] = changes['finalmod']
+        return self.event_of(j)
+
+    def event_dict(self, index, rids=None):
+        return {'time' : self.time(index),
+                'rolls': {str(self.rid(j)): self.record(j) for j in self.entries(index)
+                          if rids is None or self.rid(j) in rids}}
+
+    def to_list(self, rids=None):
+        return [self.event_dict(i, rids) for i in range(self.events_base, len(self))]
+
+    def frozen(self, rids=None):
+        return HistoryView(self, rids)
+
+    @classmethod
+    def from_list(cls, events, checkpoint_every=CHECKPOINT_EVERY, archive=None, bases=None, expressions=None):
+        history = cls(checkpoint_every)
+        history.attach(archive, bases, expressions and list(expressions))
+        for event in events:
+            history.append(parse_stamp(event), {int(k): v for k, v in event['rolls'].items()})
+        return history
+
+    def to_bytes(self, rids=None):
+        if rids is not None and not rids.issuperset(set(self.rids)):
+            return GroupHistory.from_list(self.to_list(rids), self.checkpoint_every,
+                                          bases=self.bases, expressions=self.expressions).to_bytes()
+
+        parts = [COUNTS.pack(len(self.stamps), len(self.rids), len(self.values), self.checkpoint_every),
+                 BASES .pack(*self.bases)]
+        for name in COLUMNS:
+            column = getattr(self, name)
+            if byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        parts.append(bytes(self.flags.bits))
+        table = '\n'.join(self.expressions[1:]).encode('utf-8')
+        parts.append(TABLE.pack(len(table)))
+        parts.append(table)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, archive=None, version=3):
+        events, entries, values, checkpoint_every = COUNTS.unpack_from(data)
+        history = cls(checkpoint_every)
+        data    = memoryview(data)
+        offset  = COUNTS.size
+        bases   = None
+        if version >= 2:
+            bases   = BASES.unpack_from(data, offset)
+            offset += BASES.size
+        counts = {'stamps': events, 'first': events, 'values': values}
+        for name in COLUMNS:
+            if name == 'plans' and version < 3:
+                history.plans = array('H', bytes(2 * entries))
+                continue
+            column = getattr(history, name)
+            size   = column.itemsize * counts.get(name, entries)
+            column.frombytes(data[offset:offset + size])
+            if byteorder == 'big':
+                column.byteswap()
+            offset += size
+        history.flags.bits = bytearray(data[offset:offset + (values * 2 + 7) // 8])
+        history.flags.size = values
+        offset += (values * 2 + 7) // 8
+
+        expressions = ['']
+        if version >= 3:
+            length, = TABLE.unpack_from(data, offset)
+            offset += TABLE.size
+            if length:
+                expressions += bytes(data[offset:offset + length]).decode('utf-8').split('\n')
+        if archive is None and bases:
+            history.first = array('I', (f - bases[1] for f in history.first))
+            history.start = array('I', (s - bases[2] for s in history.start))
+            bases = bases[0], 0, 0
+        if archive is not None:
+            archive.expressions = expressions
+        history.attach(archive, bases, expressions)
+        history.index_checkpoints()
+        return history
+
+
+class HistoryView:
+    __slots__ = ('columns', 'flags', 'bases', 'expressions', 'checkpoint_every', 'rids', 'events', 'time')
+
+    def __init__(self, history, rids=None):
+        self.columns          = [(name, getattr(history, name), len(getattr(history, name))) for name in COLUMNS]
+        self.flags            = history.flags, len(history.flags)
+        self.bases            = history.bases
+        self.expressions      = list(history.expressions)
+        self.checkpoint_every = history.checkpoint_every
+        self.rids             = rids
+        self.events           = len(history)
+        self.time             = history.time(len(history) - 1) if len(history) else 0
+
+    def history(self):
+        history = GroupHistory(self.checkpoint_every)
+        for name, column, count in self.columns:
+            setattr(history, name, column[:count])
+        history.flags = self.flags[0].prefix(self.flags[1])
+        history.attach(None, self.bases, self.expressions)
+        return history
+
+    def to_list(self):
+        return self.history().to_list(self.rids)
+
+    def current(self):
+        return self.history().to_bytes(self.rids)
+
+
+def strip_record(record):
+    return {k: record[k] for k in RECORD_KEYS if k in record}
+
+
+def events_from_rollers(histories):
+    events   = []
+    previous = {}
+    for i in range(max((len(h) for h in histories.values()), default=0)):
+        stamp = ''
+        rolls = {}
+        for rid, history in histories.items():
+            if i >= len(history):
+                continue
+            stamp  = stamp or history[i].get('timestamp', '')
+            record = strip_record(history[i])
+            if record != previous.get(rid):
+                rolls[str(rid)] = previous[rid] = record
+        events.append({'timestamp': stamp, 'rolls': rolls})
+    return events
@@ -0,0 +1,157 @@
+from json    import dumps, loads
+from os      import replace
+from os.path import getsize, isfile
+from zlib    import crc32
+
+from polyrolly import stats
+
+
+COMPACT_EVERY = 1000
+
+
+def deferred(value):
+    if not hasattr(value, 'to_list'):
+        raise TypeError('{} is not JSON serializable'.format(type(value).__name__))
+    return value.to_list()
+
+
+def dump_compact(data):
+    return dumps(data, separators=(',', ':'), default=deferred)
+
+
+def snapshot_mark(text):
+    return {'op': 'snapshot', 'size': len(text), 'crc': crc32(text.encode('utf-8'))}
+
+
+def write_atomic(fpath, text):
+    temp = fpath + '.tmp'
+    with open(temp, 'w') as f:
+        f.write(text)
+    replace(temp, fpath)
+
+
+class Journal:
+    def __init__(self, fpath, events=0, compact_every=COMPACT_EVERY):
+        self.fpath         = fpath
+        self.log_path      = fpath + '.log'
+        self.events        = events
+        self.compact_every = compact_every
+        self.pending       = []
+        self.structural    = False
+
+    def record(self, op, **event):
+        event['op'] = op
+        self.pending.append(event)
+
+    def restructure(self):
+        self.structural = True
+
+    def needs_compaction(self):
+        return self.structural or self.events + len(self.pending) >= self.compact_every
+
+    def take(self):
+        events        = self.pending
+        self.pending  = []
+        self.events  += len(events)
+        return events
+
+    def reset(self):
+        self.events     = 0
+        self.pending    = []
+        self.structural = False
+
+    def append(self, events):
+        if events:
+            with open(self.log_path, 'a') as f:
+                f.write(''.join(dump_compact(event) + '\n' for event in events))
+
+    def write_snapshot(self, snapshot):
+        text = dump_compact(snapshot)
+        write_atomic(self.fpath, text)
+        write_atomic(self.log_path, dump_compact(snapshot_mark(text)) + '\n')
+
+
+def ordered(mapping):
+    return sorted(([name, value] for name, value in mapping.items()), key=lambda x: x[1].get('index', 0))
+
+
+def replay(snapshot, events):
+    settings = snapshot.pop('settings', None)
+    groups   = ordered(snapshot)
+    for group in groups:
+        group[1]['rollers'] = ordered(group[1]['rollers'])
+
+    for event in events:
+        try:
+            op = event['op']
+            if op == 'setting':
+                settings[event['k']] = event['v']
+                continue
+
+            group = groups[event['g']]
+            if op == 'group':
+                group[0] = event['v']
+            elif op == 'collapsed':
+                group[1]['collapsed'] = event['v']
+            elif op == 'roller':
+                roller = group[1]['rollers'][event['r']]
+                if event['k'] == 'name':
+                    roller[0] = event['v']
+                else:
+                    roller[1][event['k']] = event['v']
+            elif op == 'roll':
+                group[1].setdefault('history', []).append(event['event'])
+                stats.replay_event(group[1], event['event']['rolls'])
+            elif op == 'amend':
+                i = event['i'] - group[1].get('archive', {}).get('events', group[1].get('trimmed', 0))
+                if i < 0:
+                    if 'archive' in group[1]:
+                        group[1].setdefault('amends', []).append(event)
+                    continue
+                rolls = group[1]['history'][i]['rolls']
+                if 'values' in event['v'] or 'results' in event['v']:
+                    rolls[str(event['id'])] = event['v']
+                else:
+                    rolls[str(event['id'])].update(event['v'])
+        except (KeyError, IndexError, TypeError):
+            print('Skipping unreadable journal event: {}'.format(event))
+
+    result = {}
+    if settings is not None:
+        result['settings'] = settings
+    for g, (name, group) in enumerate(groups):
+        rollers = {}
+        for r, (roller_name, roller) in enumerate(group['rollers']):
+            roller['index'] = r
+            while roller_name in rollers:
+                roller_name += '!'
+            rollers[roller_name] = roller
+        group['index']   = g
+        group['rollers'] = rollers
+        while name in result:
+            name += '!'
+        result[name] = group
+    return result
+
+
+def load(fpath):
+    with open(fpath, 'r') as f:
+        text = f.read()
+    snapshot = loads(text)
+
+    events   = []
+    log_path = fpath + '.log'
+    if isfile(log_path) and getsize(log_path):
+        with open(log_path, 'r') as f:
+            for line in f:
+                try:
+                    events.append(loads(line))
+                except ValueError:
+                    break
+    if events and events[0].get('op') == 'snapshot':
+        if events.pop(0) != snapshot_mark(text):
+            events = []
+
+    if not events:
+        return snapshot, 0
+    return replay(snapshot, events), len(events)
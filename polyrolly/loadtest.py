@@ -0,0 +1,145 @@
+import asyncio
+from base64       import b64encode
+from json         import loads
+from os           import urandom
+from subprocess   import PIPE, Popen
+from sys          import argv, executable, stderr
+from time         import perf_counter
+from urllib.parse import quote
+
+from polyrolly.cli    import parse_options
+from polyrolly.server import OPTIONS as SERVER_OPTIONS, read_frame
+
+
+OPTIONS = dict(SERVER_OPTIONS, config='', table='', group='', clients=64, requests=20000, subscribers=4)
+del OPTIONS['save']
+
+USAGE = ('Usage: python -m polyrolly.loadtest [--config FILE] [--host HOST] [--port N] [--table NAME] [--group NAME]\n'
+         '                                    [--clients N] [--requests N] [--subscribers N]')
+
+
+async def read_head(reader):
+    status  = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            return status, headers
+        key, sep, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+
+
+async def request(reader, writer, method, path):
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n\r\n'.format(method, path).encode('utf-8'))
+    status, headers = await read_head(reader)
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    if status != 200:
+        raise RuntimeError('{} {} failed with {}: {}'.format(method, path, status, body.decode('utf-8')))
+    return loads(body)
+
+
+async def client(host, port, path, count, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(count):
+            start = perf_counter()
+            await request(reader, writer, 'POST', path)
+            latencies.append(perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def subscriber(host, port, path, received, ready):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = b64encode(urandom(16)).decode('latin-1')
+    writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 'Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n'.format(path, key).encode('utf-8'))
+    status, headers = await read_head(reader)
+    if status != 101:
+        raise RuntimeError('Subscribing to {} failed with {}'.format(path, status))
+    ready.release()
+    try:
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 1:
+                received.append(len(loads(payload).get('events', ())))
+    finally:
+        writer.close()
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+
+async def run(host, port, table, group, clients, requests, subscribers):
+    reader, writer = await asyncio.open_connection(host, port)
+    tables = (await request(reader, writer, 'GET', '/tables'))['tables']
+    writer.close()
+    table = table or tables[0]['name']
+    group = group or next(t for t in tables if t['name'] == table)['groups'][0]['name']
+    path  = '/tables/{}/groups/{}'.format(quote(table, safe=''), quote(group, safe=''))
+
+    received = []
+    ready    = asyncio.Semaphore(0)
+    watchers = [asyncio.create_task(subscriber(host, port, path + '/events', received, ready))
+                for i in range(subscribers)]
+    for watcher in watchers:
+        await ready.acquire()
+
+    latencies = []
+    start     = perf_counter()
+    await asyncio.gather(*(client(host, port, path + '/roll', requests // clients + (i < requests % clients), latencies)
+                           for i in range(clients)))
+    elapsed = perf_counter() - start
+
+    await asyncio.sleep(.2)
+    for watcher in watchers:
+        watcher.cancel()
+    await asyncio.gather(*watchers, return_exceptions=True)
+
+    latencies.sort()
+    print('{} / {}: {} rolls from {} clients in {:.2f} s, {:.0f} rolls/s'.format(
+        table, group, requests, clients, elapsed, requests / elapsed))
+    print('latency p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms'.format(
+        percentile(latencies, .5), percentile(latencies, .99), latencies[-1] * 1000))
+    if subscribers:
+        print('{} subscribers received {} events in {} messages'.format(subscribers, sum(received), len(received)))
+
+
+def start_server(config, host, port):
+    server = Popen([executable, '-m', 'polyrolly.cli', 'serve', config, '--host', host, '--port', str(port)],
+                   stdout=PIPE, universal_newlines=True)
+    if not server.stdout.readline().startswith('Serving'):
+        server.wait()
+        raise RuntimeError('Server for {} did not start'.format(config))
+    return server
+
+
+def main(args=None):
+    try:
+        options, positional = parse_options(argv[1:] if args is None else args, OPTIONS)
+        if positional:
+            raise ValueError('Unexpected argument {}'.format(positional[0]))
+    except ValueError as e:
+        print(e, file=stderr)
+        print(USAGE, file=stderr)
+        return 2
+
+    config = options.pop('config')
+    server = None
+    try:
+        if config:
+            server = start_server(config, options['host'], options['port'])
+        asyncio.run(run(**options))
+    except (OSError, RuntimeError) as e:
+        print(e, file=stderr)
+        return 1
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
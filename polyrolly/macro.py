@@ -0,0 +1,31 @@
+from polyrolly         import engine
+from polyrolly.history import now
+
+
+ROLL_ACTIONS = ('roll_group', 'roll')
+
+
+class Macro:
+    def __init__(self):
+        self.steps = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    def append(self, target, action, **options):
+        self.steps.append((target, action, options))
+
+    @property
+    def rolls_only(self):
+        return all(action in ROLL_ACTIONS for target, action, options in self.steps)
+
+
+def model_rolls(history, rids, config, stats, n, source=None, group_stats=None):
+    for result in engine.roll(config, n, source):
+        rolls = {}
+        for rid, roller, rolled, accumulator in zip(rids, config.rollers, result.results, stats):
+            accumulator.add(rolled.total, rolled.dice, rolled.die_faces)
+            rolls[rid] = engine.hist_record(roller, rolled.dice)
+        if group_stats is not None:
+            group_stats.add(result.total)
+        yield history.append(now(), rolls)
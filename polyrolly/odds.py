@@ -0,0 +1,179 @@
+from bisect      import bisect_left
+from collections import Counter, OrderedDict
+from itertools   import accumulate
+from random      import Random
+
+from polyrolly import engine, expression
+
+
+CACHE_SIZE = 4096
+SAMPLES    = 20000
+
+pmf_cache = OrderedDict()
+numpy     = False
+
+
+def load_numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+class Distribution:
+    __slots__ = ('offset', 'probs', 'cdf', 'mean', 'variance')
+
+    def __init__(self, offset, probs, cdf=None, mean=None, variance=None):
+        self.offset   = offset
+        self.probs    = probs
+        self.cdf      = cdf
+        self.mean     = mean
+        self.variance = variance
+
+        if mean is None:
+            self.mean     = sum(p * i for i, p in enumerate(probs)) + offset
+            self.variance = sum(p * (i + offset - self.mean) ** 2 for i, p in enumerate(probs))
+        if cdf is None:
+            self.cdf = tuple(accumulate(probs))
+
+    def __len__(self):
+        return len(self.probs)
+
+    @property
+    def low(self):
+        return self.offset
+
+    @property
+    def high(self):
+        return self.offset + len(self.probs) - 1
+
+    @property
+    def std(self):
+        return self.variance ** .5
+
+    def shift(self, n):
+        return Distribution(self.offset + n, self.probs, self.cdf, self.mean + n, self.variance)
+
+    def p(self, total):
+        i = total - self.offset
+        return self.probs[i] if 0 <= i < len(self.probs) else 0.0
+
+    def at_most(self, total):
+        i = total - self.offset
+        if i < 0:
+            return 0.0
+        if i >= len(self.cdf) - 1:
+            return 1.0
+        return min(1.0, self.cdf[i])
+
+    def at_least(self, total):
+        return 1.0 - self.at_most(total - 1)
+
+    def quantile(self, q):
+        return self.offset + min(bisect_left(self.cdf, q * self.cdf[-1]), len(self.cdf) - 1)
+
+
+def add_die(probs, faces):
+    out     = []
+    running = 0.0
+    n       = len(probs)
+    for i in range(n + faces - 1):
+        if i < n:
+            running += probs[i]
+        if i >= faces:
+            running -= probs[i - faces]
+        out.append(max(running, 0.0) / faces)
+    return tuple(out)
+
+
+def convolve(a, b):
+    np = load_numpy()
+    if np is not None:
+        return tuple(np.convolve(a, b).tolist())
+
+    out = [0.0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            out[i + j] += x * y
+    return tuple(out)
+
+
+def remember(key, dist):
+    pmf_cache[key] = dist
+    if len(pmf_cache) > CACHE_SIZE:
+        pmf_cache.popitem(last=False)
+    return dist
+
+
+def sum_pmf(qty, faces):
+    key  = (qty, faces)
+    dist = pmf_cache.get(key)
+    if dist is not None:
+        pmf_cache.move_to_end(key)
+        return dist
+
+    if qty == 1:
+        return remember(key, Distribution(1, (1.0 / faces,) * faces))
+
+    prev = pmf_cache.get((qty - 1, faces))
+    if prev is not None:
+        return remember(key, Distribution(qty, add_die(prev.probs, faces)))
+
+    if load_numpy() is None:
+        probs = sum_pmf(qty - 1, faces).probs
+    else:
+        half  = sum_pmf(qty // 2, faces).probs
+        probs = convolve(half, half)
+        if qty % 2 == 0:
+            return remember(key, Distribution(qty, probs))
+    return remember(key, Distribution(qty, add_die(probs, faces)))
+
+
+def expression_samples(text):
+    key     = ('expression', text)
+    samples = pmf_cache.get(key)
+    if samples is not None:
+        pmf_cache.move_to_end(key)
+        return samples
+
+    plan    = expression.compiled(text)
+    randint = Random(plan.text).randint
+    take    = lambda faces: randint(1, faces)
+    joint   = Counter()
+    crit = fail = either = 0
+    for i in range(SAMPLES):
+        outcome = engine.Outcome(*plan.evaluate(take))
+        joint[outcome.score, outcome.per_die] += 1
+        crit   += outcome.crits > 0
+        fail   += outcome.fails > 0
+        either += outcome.crits > 0 or outcome.fails > 0
+    special = {'crit': crit / SAMPLES, 'fail': fail / SAMPLES, 'either': either / SAMPLES}
+    return remember(key, (joint, special))
+
+
+def describe(config):
+    if config.expression:
+        return '{}:  {} {:+} {:+}'.format(config.name, config.expression, config.modifier, config.finalmod)
+    return '{}:  {}d{} {:+} {:+}'.format(config.name, config.dice_qty, config.die_faces, config.modifier, config.finalmod)
+
+
+def distribution(config):
+    if config.expression:
+        totals = Counter()
+        for (score, per_die), n in expression_samples(config.expression)[0].items():
+            totals[score + per_die * config.modifier + config.finalmod] += n
+        low = min(totals)
+        return Distribution(low, tuple(totals[t] / SAMPLES for t in range(low, max(totals) + 1)))
+    return sum_pmf(config.dice_qty, config.die_faces).shift(config.dice_qty * config.modifier + config.finalmod)
+
+
+def special_odds(config):
+    if config.expression:
+        return expression_samples(config.expression)[1]
+    qty, faces = config.dice_qty, config.die_faces
+    return {'crit'  : 1.0 - ((faces - 1) / faces) ** qty,
+            'fail'  : 1.0 - ((faces - 1) / faces) ** qty,
+            'either': 1.0 - ((faces - 2) / faces) ** qty}
@@ -0,0 +1,124 @@
+from os        import urandom
+from threading import Lock
+
+
+BUFFER_SIZE = 4096
+
+MASK32   = (1 << 32) - 1
+MASK64   = (1 << 64) - 1
+PCG_MULT = 6364136223846793005
+PCG_INC  = 1442695040888963407
+
+WORDS = ((1, 'B'), (2, 'H'), (4, 'I'))
+
+
+def word(span):
+    for width, code in WORDS:
+        if span <= 1 << 8 * width:
+            return width, code
+    raise ValueError('range of {} is too wide'.format(span))
+
+
+def pcg_advance(state, delta):
+    acc_mult, acc_plus = 1, 0
+    cur_mult, cur_plus = PCG_MULT, PCG_INC
+    while delta:
+        if delta & 1:
+            acc_mult = acc_mult * cur_mult & MASK64
+            acc_plus = (acc_plus * cur_mult + cur_plus) & MASK64
+        cur_plus = (cur_mult + 1) * cur_plus & MASK64
+        cur_mult = cur_mult * cur_mult & MASK64
+        delta  >>= 1
+    return (acc_mult * state + acc_plus) & MASK64
+
+
+class SystemBackend:
+    name = 'system'
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.buffer      = b''
+        self.pos         = 0
+        self.reads       = 0
+        self.lock        = Lock()
+
+    def take(self, n):
+        if self.pos + n > len(self.buffer):
+            self.buffer = self.buffer[self.pos:] + urandom(max(self.buffer_size, n))
+            self.pos    = 0
+            self.reads += 1
+        self.pos += n
+        return self.buffer[self.pos - n:self.pos]
+
+    def integers(self, low, high, size):
+        span         = high - low + 1
+        width, code  = word(span)
+        limit        = (1 << 8 * width) - (1 << 8 * width) % span
+        values       = []
+        with self.lock:
+            while len(values) < size:
+                words = memoryview(self.take((size - len(values)) * width)).cast(code)
+                values.extend(low + w % span for w in words if w < limit)
+        return values
+
+    def randint(self, low, high):
+        return self.integers(low, high, 1)[0]
+
+
+class SeededBackend:
+    name = 'seeded'
+
+    def __init__(self, seed=None, position=0):
+        self.lock = Lock()
+        self.reseed(int.from_bytes(urandom(4), 'little') if seed is None else seed, position)
+
+    def reseed(self, seed, position=0):
+        with self.lock:
+            self.seed     = seed
+            self.origin   = (PCG_INC + (seed & MASK64)) * PCG_MULT + PCG_INC & MASK64
+            self.state    = pcg_advance(self.origin, position)
+            self.position = position
+
+    def to_dict(self):
+        return {'seed': self.seed, 'position': self.position}
+
+    def integers(self, low, high, size):
+        span = high - low + 1
+        if not 0 < span <= 1 << 32:
+            raise ValueError('range of {} is too wide'.format(span))
+        threshold = ((1 << 32) - span) % span
+        values    = []
+        append    = values.append
+        with self.lock:
+            state = self.state
+            drawn = 0
+            while len(values) < size:
+                old    = state
+                state  = (old * PCG_MULT + PCG_INC) & MASK64
+                drawn += 1
+                x      = ((old >> 18) ^ old) >> 27 & MASK32
+                r      = old >> 59
+                x      = (x >> r | x << (32 - r)) & MASK32
+                if x >= threshold:
+                    append(low + x % span)
+            self.state     = state
+            self.position += drawn
+        return values
+
+    def randint(self, low, high):
+        return self.integers(low, high, 1)[0]
+
+
+system = SystemBackend()
+seeded = SeededBackend()
+
+backends = {system.name: system, seeded.name: seeded}
+
+
+def get(name):
+    if name not in backends:
+        if name != 'random.org':
+            raise ValueError('Unknown RNG backend {}'.format(name))
+        from polyrolly.entropy import EntropyPool
+        backends[name] = EntropyPool()
+    return backends[name]
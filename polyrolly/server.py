@@ -0,0 +1,455 @@
+import asyncio
+from base64       import b64encode
+from hashlib      import sha1
+from json         import dumps, loads
+from os.path      import basename, splitext
+from shutil       import rmtree
+from signal       import SIGTERM
+from struct       import Struct
+from tempfile     import mkdtemp
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from polyrolly         import container, engine, journal, store
+from polyrolly.archive import archive_dir
+from polyrolly.history import now
+from polyrolly.stats   import RunningStats
+
+
+OPTIONS = {'host': '127.0.0.1', 'port': 8765, 'save': False}
+
+WS_GUID     = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_BODY    = 1 << 16
+MAX_BUFFER  = 1 << 20
+SHORT_FRAME = Struct('!BBH')
+LONG_FRAME  = Struct('!BBQ')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+STORED_RANGES = (('dice_qty', 1, 255), ('die_faces', 2, 255), ('modifier', -128, 127), ('finalmod', -128, 127))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def frame(payload, opcode=1):
+    n = len(payload)
+    if n < 126:
+        return bytes((0x80 | opcode, n)) + payload
+    if n < 1 << 16:
+        return SHORT_FRAME.pack(0x80 | opcode, 126, n) + payload
+    return LONG_FRAME.pack(0x80 | opcode, 127, n) + payload
+
+
+async def read_frame(reader):
+    b0, b1 = await reader.readexactly(2)
+    n      = b1 & 127
+    if n == 126:
+        n = SHORT_FRAME.unpack(b'\0\0' + await reader.readexactly(2))[2]
+    elif n == 127:
+        n = LONG_FRAME.unpack(b'\0\0' + await reader.readexactly(8))[2]
+    if n > MAX_BODY:
+        raise ValueError('WebSocket frame of {} bytes is too large'.format(n))
+    mask    = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    return b0 & 15, payload
+
+
+class Subscriber:
+    __slots__ = ('writer',)
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def send(self, data):
+        if self.writer.is_closing():
+            return False
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.writer.close()
+            return False
+        self.writer.write(data)
+        return True
+
+
+def check_roller(group, config):
+    for key, low, high in STORED_RANGES:
+        if config.expression and key in ('dice_qty', 'die_faces'):
+            continue
+        value = getattr(config, key)
+        if not low <= value <= high:
+            raise ValueError('{} / {}: {} {} is outside {}..{}'.format(group, config.name, key, value, low, high))
+
+
+def broadcast(subscribers, message):
+    if not subscribers:
+        return
+    data = frame(dumps(message, separators=(',', ':')).encode('utf-8'))
+    for subscriber in list(subscribers):
+        if not subscriber.send(data):
+            subscribers.discard(subscriber)
+
+
+class TableGroup:
+    def __init__(self, table, name, settings):
+        self.table       = table
+        self.name        = name
+        self.settings    = settings
+        self.subscribers = set()
+        self.queue       = {}
+
+        rollers, self.store = store.load_group(table.fpath, settings, table.archive_dir)
+        self.index  = self.store.events - 1
+        self.specs  = [spec for name, spec in rollers]
+        self.rids   = [spec['id'] for spec in self.specs]
+        self.stats  = RunningStats.from_dict(settings.get('stats'))
+        self.roller_stats = [RunningStats.from_dict(spec.get('stats')) for spec in self.specs]
+        self.config = engine.GroupConfig(name, settings.get('index', 0),
+                                         [engine.RollerConfig.from_dict(*roller) for roller in rollers])
+        for config in self.config.rollers:
+            check_roller(name, config)
+
+    @property
+    def history(self):
+        return self.store.history
+
+    def roller(self, name):
+        for i, config in enumerate(self.config.rollers):
+            if config.name == name:
+                return i
+        raise HTTPError(404, 'No such roller: {}'.format(name))
+
+    def describe(self):
+        return {'name'   : self.name                                   ,
+                'rollers': [config.name for config in self.config.rollers],
+                'events' : self.store.events                                  ,
+                'index'  : self.index                                  }
+
+    def request(self, roller=None):
+        future = asyncio.get_running_loop().create_future()
+        if not self.queue:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.queue.setdefault(roller, []).append(future)
+        return future
+
+    def flush(self):
+        queue, self.queue = self.queue, {}
+        try:
+            events = self.roll_queue(queue)
+        except Exception as e:
+            for futures in queue.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            raise
+        message = {'type': 'roll', 'table': self.table.name, 'group': self.name, 'events': events}
+        broadcast(self.subscribers, message)
+        broadcast(self.table.subscribers, message)
+
+    def roll_queue(self, queue):
+        events = []
+        stamp  = now()
+        for roller, futures in queue.items():
+            if roller is None:
+                configs = self.config.rollers
+                rids    = self.rids
+                stats   = self.roller_stats
+                results = [result.results for result in engine.roll(self.config, len(futures))]
+            else:
+                configs = [self.config.rollers[roller]]
+                rids    = [self.rids[roller]]
+                stats   = [self.roller_stats[roller]]
+                results = [[result] for result in engine.roll(configs[0], len(futures))]
+            for future, rolled in zip(futures, results):
+                rolls      = {rid: engine.hist_record(config, result.dice)
+                              for rid, config, result in zip(rids, configs, rolled)}
+                for accumulator, result in zip(stats, rolled):
+                    accumulator.add(result.total, result.dice, result.die_faces)
+                if len(rolled) == len(self.rids):
+                    self.stats.add(sum(result.total for result in rolled))
+                self.index = self.history.append(stamp, rolls)
+                event      = self.roll_dict(self.index, stamp, configs, rolled)
+                events.append(event)
+                if not future.cancelled():
+                    future.set_result(event)
+        return events
+
+    def roll_dict(self, index, stamp, configs, results):
+        rollers = [{'name': config.name, 'total': result.total, 'values': result.values, 'text': result.text}
+                   for config, result in zip(configs, results)]
+        return {'index': index, 'time': stamp, 'total': sum(r['total'] for r in rollers), 'rollers': rollers}
+
+    def view(self, index):
+        history = self.history
+        if not len(history):
+            return {'index': -1, 'events': 0, 'rollers': []}
+        if not history.oldest <= index < len(history):
+            raise HTTPError(404, 'No history event {}'.format(index))
+        state   = history.state_at(index, set(self.rids))
+        rolled  = {history.rid(j) for j in history.entries(index)}
+        rollers = []
+        for rid, config in zip(self.rids, self.config.rollers):
+            record = state.get(rid)
+            if record is None:
+                continue
+            rollers.append({'name'  : config.name                                            ,
+                            'total' : record['dice'].total(record['modifier'], record['finalmod']),
+                            'values': record['values']                                       ,
+                            'text'  : record['results_text']                                 ,
+                            'rolled': rid in rolled                                          })
+        return {'index'  : index                          ,
+                'events' : len(history)                   ,
+                'oldest' : history.oldest                 ,
+                'time'   : history.time(index)            ,
+                'total'  : sum(r['total'] for r in rollers),
+                'rollers': rollers                        }
+
+    def navigate(self, offset=0, index=None):
+        count = len(self.history)
+        if not count:
+            return self.view(-1)
+        index      = self.index + offset if index is None else index
+        self.index = max(self.history.oldest, min(count - 1, index))
+        event      = self.view(self.index)
+        message    = {'type': 'navigate', 'table': self.table.name, 'group': self.name, 'event': event}
+        broadcast(self.subscribers, message)
+        broadcast(self.table.subscribers, message)
+        return event
+
+    def snapshot(self, binary):
+        settings = dict(self.settings)
+        for spec, stats in zip(self.specs, self.roller_stats):
+            if stats.count:
+                spec['stats'] = stats.to_dict()
+        if self.stats.count:
+            settings['stats'] = self.stats.to_dict()
+        return self.store.save(settings, set(self.rids), binary)
+
+
+class GameTable:
+    def __init__(self, fpath, name):
+        self.fpath       = fpath
+        self.name        = name
+        self.binary      = container.is_container(fpath)
+        self.subscribers = set()
+        self.scratch     = None
+        self.saved       = False
+
+        snapshot      = container.read(fpath) if self.binary else journal.load(fpath)[0]
+        self.settings = snapshot.pop('settings', None)
+        self.groups   = {}
+        for group_name, settings in journal.ordered(snapshot):
+            self.groups[group_name] = TableGroup(self, group_name, settings)
+
+    def group(self, name):
+        try:
+            return self.groups[name]
+        except KeyError:
+            raise HTTPError(404, 'No such group: {}'.format(name))
+
+    def describe(self):
+        return {'name': self.name, 'groups': [group.describe() for group in self.groups.values()]}
+
+    def archive_dir(self):
+        if self.saved:
+            return archive_dir(self.fpath)
+        if self.scratch is None:
+            self.scratch = mkdtemp(prefix='poly-rolly-')
+        return self.scratch
+
+    def drop_scratch(self):
+        if self.scratch is not None:
+            rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+    def close(self):
+        for group in self.groups.values():
+            if group.store.archive is not None:
+                group.store.archive.close()
+        self.drop_scratch()
+
+    def save(self):
+        for group in self.groups.values():
+            if group.store.archive is not None:
+                group.store.archive.relocate(archive_dir(self.fpath))
+        snapshot = {}
+        if self.settings is not None:
+            snapshot['settings'] = self.settings
+        for name, group in self.groups.items():
+            snapshot[name] = group.snapshot(self.binary)
+        if self.binary:
+            container.write(self.fpath, snapshot)
+        else:
+            journal.Journal(self.fpath).write_snapshot(snapshot)
+        self.saved = True
+        self.drop_scratch()
+
+
+class RollServer:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise HTTPError(404, 'No such table: {}'.format(name))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    if headers.get('upgrade', '').lower() == 'websocket':
+                        return await self.subscribe(path, headers, reader, writer)
+                    status, result = 200, await self.route(method, path, query, body)
+                except HTTPError as e:
+                    status, result = e.status, {'error': str(e)}
+                except ValueError as e:
+                    status, result = 400, {'error': str(e)}
+                data = dumps(result, separators=(',', ':')).encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n'.format(
+                    status, REASONS[status], len(data), '' if keep_alive else 'Connection: close\r\n'
+                ).encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, version = line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            key, sep, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+            headers['connection'] = 'close'
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY:
+            raise ValueError('Request body of {} bytes is too large'.format(length))
+        body  = await reader.readexactly(length) if length else b''
+        parts = urlsplit(target)
+        path  = [unquote(part) for part in parts.path.split('/') if part]
+        return method, path, parse_qs(parts.query), headers, body
+
+    async def route(self, method, path, query, body):
+        if not path or path == ['tables']:
+            return {'tables': [table.describe() for table in self.tables.values()]}
+        if len(path) < 2 or path[0] != 'tables':
+            raise HTTPError(404, 'No such resource: /{}'.format('/'.join(path)))
+        table = self.table(path[1])
+        if len(path) == 2:
+            return table.describe()
+        if len(path) < 4 or path[2] != 'groups':
+            raise HTTPError(404, 'No such resource: /{}'.format('/'.join(path)))
+        group  = table.group(path[3])
+        action = path[4:]
+        if not action:
+            return group.describe()
+        if action == ['roll']:
+            self.allow(method, 'POST')
+            return await group.request()
+        if len(action) == 3 and action[0] == 'rollers' and action[2] == 'roll':
+            self.allow(method, 'POST')
+            return await group.request(group.roller(action[1]))
+        if action == ['history'] and method == 'GET':
+            return group.view(int(query['index'][0]) if 'index' in query else group.index)
+        if action == ['history']:
+            self.allow(method, 'POST')
+            params = loads(body) if body else {}
+            if not isinstance(params, dict):
+                raise ValueError('History navigation expects an object with offset or index')
+            index  = params.get('index')
+            return group.navigate(int(params.get('offset', 0)), None if index is None else int(index))
+        raise HTTPError(404, 'No such resource: /{}'.format('/'.join(path)))
+
+    @staticmethod
+    def allow(method, expected):
+        if method != expected:
+            raise HTTPError(405, '{} expects {}'.format(method, expected))
+
+    async def subscribe(self, path, headers, reader, writer):
+        if len(path) == 3 and path[0] == 'tables' and path[2] == 'events':
+            subscribers = self.table(path[1]).subscribers
+        elif len(path) == 5 and path[0] == 'tables' and path[2] == 'groups' and path[4] == 'events':
+            subscribers = self.table(path[1]).group(path[3]).subscribers
+        else:
+            raise HTTPError(404, 'No such event stream: /{}'.format('/'.join(path)))
+        if 'sec-websocket-key' not in headers:
+            raise HTTPError(400, 'WebSocket upgrade without Sec-WebSocket-Key')
+
+        accept = b64encode(sha1((headers['sec-websocket-key'] + WS_GUID).encode('latin-1')).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        subscriber = Subscriber(writer)
+        subscribers.add(subscriber)
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == 8:
+                    writer.write(frame(payload[:2], 8))
+                    break
+                if opcode == 9:
+                    writer.write(frame(payload, 10))
+        finally:
+            subscribers.discard(subscriber)
+
+
+def load_tables(files):
+    tables = {}
+    for fpath in files:
+        name = splitext(basename(fpath))[0]
+        while name in tables:
+            name += '!'
+        tables[name] = GameTable(fpath, name)
+    return tables
+
+
+async def run(server, host, port):
+    try:
+        asyncio.get_running_loop().add_signal_handler(SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    listener = await asyncio.start_server(server.handle, host, port)
+    print('Serving {} on http://{}:{}'.format(', '.join(server.tables), host, port), flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def serve(files, host=OPTIONS['host'], port=OPTIONS['port'], save=False):
+    try:
+        tables = load_tables(files)
+    except (OSError, ValueError) as e:
+        print('Cannot load tables: {}'.format(e))
+        return 1
+
+    try:
+        asyncio.run(run(RollServer(tables), host, port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    except OSError as e:
+        print('Cannot serve on {}:{}: {}'.format(host, port, e))
+        return 1
+    finally:
+        for table in tables.values():
+            if save:
+                table.save()
+            table.close()
+    return 0
@@ -0,0 +1,100 @@
+from collections        import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing    import get_context
+from os                 import cpu_count
+from random             import Random, SystemRandom
+
+from polyrolly import engine
+
+
+CHUNK_SIZE = 100000
+
+executors = {}
+
+
+class SimulationResult:
+    __slots__ = ('names', 'trials', 'histograms', 'wins')
+
+    def __init__(self, names):
+        self.names      = names
+        self.trials     = 0
+        self.histograms = [Counter() for n in names]
+        self.wins       = [[0] * len(names) for n in names]
+
+    def merge(self, trials, histograms, wins):
+        self.trials += trials
+        for merged, hist in zip(self.histograms, histograms):
+            merged.update(hist)
+        for merged, row in zip(self.wins, wins):
+            for j, n in enumerate(row):
+                merged[j] += n
+
+    def mean(self, i):
+        return sum(t * n for t, n in self.histograms[i].items()) / self.trials
+
+    def std(self, i):
+        mean = self.mean(i)
+        return (sum(n * (t - mean) ** 2 for t, n in self.histograms[i].items()) / self.trials) ** .5
+
+    def low(self, i):
+        return min(self.histograms[i])
+
+    def high(self, i):
+        return max(self.histograms[i])
+
+    def p_beats(self, i, j):
+        return self.wins[i][j] / self.trials
+
+    def p_tie(self, i, j):
+        return 1.0 - self.p_beats(i, j) - self.p_beats(j, i)
+
+
+def run_chunk(groups, trials, seed):
+    try:
+        import numpy as np
+        from polyrolly import bulk
+    except ImportError:
+        np = None
+
+    if np is None:
+        rng    = Random('{}-{}'.format(*seed))
+        totals = [[g.total for g in engine.roll(group, trials, rng)] for group in groups]
+        wins   = [[sum(x > y for x, y in zip(a, b)) for b in totals] for a in totals]
+        return trials, [Counter(t) for t in totals], wins
+
+    rng    = np.random.default_rng(list(seed))
+    totals = [bulk.roll(group, trials, rng=rng, keep_dice=False).totals for group in groups]
+    hists  = []
+    for t in totals:
+        values, counts = np.unique(t, return_counts=True)
+        hists.append(dict(zip(values.tolist(), counts.tolist())))
+    wins   = [[int(np.count_nonzero(a > b)) for b in totals] for a in totals]
+    return trials, hists, wins
+
+
+def get_executor(workers):
+    if workers not in executors:
+        executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+    return executors[workers]
+
+
+def simulate(groups, trials, workers=None, seed=None, progress=None, cancel=None, chunk_size=CHUNK_SIZE):
+    workers = workers or cpu_count() or 1
+    seed    = seed if seed is not None else SystemRandom().getrandbits(64)
+    chunks  = max(workers, -(-trials // chunk_size))
+    sizes   = [trials // chunks + (i < trials % chunks) for i in range(chunks)]
+    result  = SimulationResult([group.name for group in groups])
+
+    executor = get_executor(workers)
+    futures  = [executor.submit(run_chunk, groups, size, (seed, i)) for i, size in enumerate(sizes) if size]
+
+    for future in as_completed(futures):
+        if cancel is not None and cancel.is_set():
+            for f in futures:
+                f.cancel()
+            return None
+        result.merge(*future.result())
+        if progress:
+            progress(result.trials, trials)
+
+    return result
@@ -0,0 +1,171 @@
+from math import exp, lgamma, log
+
+from polyrolly import engine
+
+
+MIN_EXPECTED = 5
+HISTOGRAM_ROWS = 24
+
+
+def gamma_q(a, x):
+    if x <= 0:
+        return 1.0
+    scale = exp(a * log(x) - x - lgamma(a))
+    if x < a + 1:
+        term = total = 1.0 / a
+        n    = a
+        for i in range(1000):
+            n     += 1
+            term  *= x / n
+            total += term
+            if term < total * 1e-12:
+                break
+        return max(0.0, 1.0 - total * scale)
+    b = x + 1 - a
+    c = 1e300
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d  = an * d + b
+        c  = b + an / c
+        d  = 1 / (d or 1e-300)
+        c  = c or 1e-300
+        h *= d * c
+        if abs(d * c - 1) < 1e-12:
+            break
+    return scale * h
+
+
+def chi_square_sf(chi2, dof):
+    return gamma_q(dof / 2, chi2 / 2)
+
+
+def draws(dice, faces):
+    segments = getattr(dice, 'segments', None)
+    if segments is None:
+        if faces:
+            for n in dice.values:
+                yield faces, n
+        return
+    for sign, start, stop, faces, pool in segments:
+        for k in range(start, stop):
+            yield faces, dice.values[k]
+
+
+class RunningStats:
+    __slots__ = ('count', 'mean', 'm2', 'low', 'high', 'dice', 'crits', 'fails', 'totals', 'faces')
+
+    def __init__(self):
+        self.count  = 0
+        self.mean   = 0.0
+        self.m2     = 0.0
+        self.low    = None
+        self.high   = None
+        self.dice   = 0
+        self.crits  = 0
+        self.fails  = 0
+        self.totals = {}
+        self.faces  = {}
+
+    def add(self, total, dice=None, faces=0):
+        self.count += 1
+        delta       = total - self.mean
+        self.mean  += delta / self.count
+        self.m2    += delta * (total - self.mean)
+        self.low    = total if self.low  is None else min(self.low , total)
+        self.high   = total if self.high is None else max(self.high, total)
+        self.totals[total] = self.totals.get(total, 0) + 1
+        if dice is None:
+            return
+        self.dice  += len(dice)
+        self.crits += dice.crits
+        self.fails += dice.fails
+        for f, n in draws(dice, faces):
+            counts = self.faces.get(f)
+            if counts is None:
+                counts = self.faces[f] = [0] * f
+            if 1 <= n <= f:
+                counts[n - 1] += 1
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** .5
+
+    @property
+    def crit_rate(self):
+        return self.crits / self.dice if self.dice else 0.0
+
+    @property
+    def fail_rate(self):
+        return self.fails / self.dice if self.dice else 0.0
+
+    def fairness(self):
+        results = []
+        for faces, counts in sorted(self.faces.items()):
+            n        = sum(counts)
+            expected = n / faces
+            if expected < MIN_EXPECTED:
+                results.append((faces, n, None, faces - 1, None))
+                continue
+            chi2 = sum((c - expected) ** 2 for c in counts) / expected
+            results.append((faces, n, chi2, faces - 1, chi_square_sf(chi2, faces - 1)))
+        return results
+
+    def histogram(self, rows=HISTOGRAM_ROWS):
+        if not self.totals:
+            return []
+        width   = -(-(self.high - self.low + 1) // rows)
+        buckets = {}
+        for total, n in self.totals.items():
+            k = (total - self.low) // width
+            buckets[k] = buckets.get(k, 0) + n
+        return [(self.low + k * width, self.low + k * width + width - 1, buckets.get(k, 0))
+                for k in range(max(buckets) + 1)]
+
+    def to_dict(self):
+        return {'count' : self.count ,
+                'mean'  : self.mean  ,
+                'm2'    : self.m2    ,
+                'low'   : self.low   ,
+                'high'  : self.high  ,
+                'dice'  : self.dice  ,
+                'crits' : self.crits ,
+                'fails' : self.fails ,
+                'totals': {str(k): v for k, v in self.totals.items()},
+                'faces' : {str(k): v for k, v in self.faces .items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        if not data:
+            return stats
+        for k in ('count', 'mean', 'm2', 'low', 'high', 'dice', 'crits', 'fails'):
+            setattr(stats, k, data[k])
+        stats.totals = {int(k): v       for k, v in data['totals'].items()}
+        stats.faces  = {int(k): list(v) for k, v in data['faces' ].items()}
+        return stats
+
+
+def replay_event(group, rolls):
+    rollers = {settings.get('id', settings.get('index', r)): settings
+               for r, (name, settings) in enumerate(group['rollers'])}
+    total   = 0
+    for rid, record in rolls.items():
+        dice   = engine.Dice.from_record(record)
+        result = dice.total(record.get('modifier', 0), record.get('finalmod', 0))
+        total += result
+        settings = rollers.get(int(rid))
+        if settings is not None:
+            stats = RunningStats.from_dict(settings.get('stats'))
+            stats.add(result, dice, record.get('die_faces', 0))
+            settings['stats'] = stats.to_dict()
+    if len(rolls) == len(rollers):
+        stats = RunningStats.from_dict(group.get('stats'))
+        stats.add(total)
+        group['stats'] = stats.to_dict()
@@ -0,0 +1,110 @@
+from polyrolly         import container, journal
+from polyrolly.archive import HistoryArchive, archive_dir
+from polyrolly.history import GroupHistory, events_from_rollers
+
+
+SAVED_KEYS = ('archive', 'retention', 'rollups', 'carried', 'history', 'trimmed')
+
+
+def open_archive(fpath, ref):
+    if ref is None:
+        return None
+    try:
+        return HistoryArchive.open(archive_dir(fpath), ref)
+    except (OSError, ValueError) as e:
+        print('Dropping archived history: {}'.format(e))
+        return None
+
+
+class GroupStore:
+    def __init__(self, archive_dir, retention=None, rollups=None, carried=None):
+        self.archive_dir = archive_dir
+        self.retention   = retention or {}
+        self.rollups     = rollups
+        self.carried     = carried
+        self.reader      = None
+        self.loaded      = None
+        self.next_rid    = 0
+
+    @property
+    def history(self):
+        if self.loaded is None:
+            self.history = self.reader.history() if self.reader is not None else GroupHistory()
+        return self.loaded
+
+    @history.setter
+    def history(self, history):
+        history.archive_dir = self.archive_dir
+        history.load_rollups(self.rollups)
+        history.load_carried(self.carried)
+        history.retain(self.retention)
+        self.loaded  = history
+        self.reader  = None
+        self.rollups = None
+        self.carried = None
+
+    @property
+    def archive(self):
+        if self.reader is not None:
+            return self.reader.archive
+        return self.loaded.archive if self.loaded is not None else None
+
+    @property
+    def events(self):
+        if self.reader is not None:
+            return self.reader.events
+        return len(self.history)
+
+    @property
+    def time(self):
+        if self.reader is not None:
+            return self.reader.time
+        return self.history.time(len(self.history) - 1) if len(self.history) else 0
+
+    def save(self, settings, rids, binary=False):
+        for key in SAVED_KEYS:
+            settings.pop(key, None)
+        if self.archive is not None:
+            self.archive.flush()
+            settings['archive'] = self.archive.ref()
+        if self.retention:
+            settings['retention'] = self.retention
+        rollups = self.rollups if self.reader is not None else self.history.rollups_to_dict()
+        if rollups:
+            settings['rollups'] = rollups
+        carried = self.carried if self.reader is not None else self.history.carried_to_dict()
+        if carried:
+            settings['carried'] = carried
+        if binary and self.reader is not None:
+            self.reader.raw()
+            settings['history'] = self.reader
+        elif binary:
+            settings['history'] = container.history_section(self.history, rids)
+        else:
+            settings['history'] = self.history.frozen(rids)
+            if self.history.archive is None and self.history.events_base:
+                settings['trimmed'] = self.history.events_base
+        return settings
+
+
+def load_group(fpath, settings, archive_dir):
+    rollers   = journal.ordered(settings['rollers'])
+    histories = {}
+    for r, (name, spec) in enumerate(rollers):
+        spec['id'] = spec.get('id', spec.get('index', r))
+        histories[spec['id']] = spec.pop('history', [])
+
+    store   = GroupStore(archive_dir, settings.get('retention'), settings.get('rollups'), settings.get('carried'))
+    archive = open_archive(fpath, settings.get('archive'))
+    history = settings.pop('history', None)
+    if isinstance(history, container.Section):
+        history.archive = archive
+        store.reader    = history
+    else:
+        if history is None:
+            history = events_from_rollers(histories)
+        store.history = GroupHistory.from_list(history, archive=archive, bases=(settings.get('trimmed', 0), 0, 0))
+    for event in settings.pop('amends', []):
+        store.history.amend(event['i'], event['id'], event['v'])
+    store.next_rid = max([spec['id'] + 1 for name, spec in rollers] + [archive.next_rid if archive else 0])
+    return rollers, store
@@ -0,0 +1,84 @@
+import os
+import shutil
+import unittest
+from json     import loads
+from tempfile import mkdtemp
+
+from polyrolly         import journal
+from polyrolly.archive import archive_dir
+from polyrolly.history import RECENT_EVENTS, SPILL_EVENTS
+from polyrolly.store   import GroupStore, load_group
+
+
+ROLLERS = {'a': {'index': 0, 'id': 0}, 'b': {'index': 1, 'id': 1}}
+
+
+def record(value, modifier=0):
+    return {'dice_qty': 2, 'die_faces': 20, 'modifier': modifier, 'finalmod': 0, 'values': [value, 21 - value]}
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir     = mkdtemp()
+        self.scratch = os.path.join(self.dir, 'scratch')
+        self.fpath   = os.path.join(self.dir, 'table.json')
+        self.store   = GroupStore(lambda: self.scratch)
+        self.history = self.store.history
+        self.history.append(1700000000, {0: record(1), 1: record(7, 3)})
+        for i in range(1, RECENT_EVENTS + SPILL_EVENTS + 20):
+            self.history.append(1700000000 + i, {0: record(1 + i % 20)})
+
+    def tearDown(self):
+        self.history.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def entries_file(self):
+        with open(self.history.archive.path('entries'), 'rb') as f:
+            return f.read()
+
+    def test_spill_keeps_old_events_readable(self):
+        history = self.history
+        self.assertIsNotNone(history.archive)
+        self.assertEqual(history.events_base, SPILL_EVENTS)
+        self.assertEqual(len(history), RECENT_EVENTS + SPILL_EVENTS + 20)
+        self.assertEqual(history.oldest, 0)
+        self.assertEqual(history.event_dict(5)['rolls']['0']['values'], [6, 15])
+        state = history.state_at(len(history) - 1)
+        self.assertEqual(state[1]['values'], [7, 14])
+        self.assertEqual(state[1]['modifier'], 3)
+
+    def test_amend_is_staged_until_save(self):
+        history = self.history
+        before  = self.entries_file()
+        self.assertEqual(history.amend(5, 0, {'modifier': 2, 'finalmod': -1}), 5)
+        self.assertEqual(history.event_dict(5)['rolls']['0']['modifier'], 2)
+        self.assertEqual(self.entries_file(), before)
+
+        self.store.save({'rollers': ROLLERS}, {0, 1})
+        self.assertNotEqual(self.entries_file(), before)
+        self.assertEqual(history.archive.amends, {})
+        self.assertEqual(history.event_dict(5)['rolls']['0']['finalmod'], -1)
+
+    def test_relocate_round_trip(self):
+        history = self.history
+        history.amend(5, 0, {'modifier': 2, 'finalmod': -1})
+        expected = [history.event_dict(i) for i in range(len(history))]
+
+        history.archive.relocate(archive_dir(self.fpath))
+        settings = self.store.save({'rollers': ROLLERS}, {0, 1})
+        settings = loads(journal.dump_compact(settings))
+        shutil.rmtree(self.scratch)
+
+        rollers, store = load_group(self.fpath, settings, None)
+        loaded = store.history
+        try:
+            self.assertEqual(store.next_rid, 2)
+            self.assertEqual(loaded.bases, history.bases)
+            self.assertEqual([loaded.event_dict(i) for i in range(len(loaded))], expected)
+            self.assertEqual(loaded.state_at(len(loaded) - 1), history.state_at(len(history) - 1))
+        finally:
+            loaded.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import os
+import shutil
+import unittest
+from copy     import deepcopy
+from json     import loads
+from tempfile import mkdtemp
+from unittest import mock
+
+from polyrolly         import cli, container, journal, rng
+from polyrolly.history import GroupHistory
+
+
+def roller(index, faces, modifier=0):
+    return {'index': index, 'id': index, 'dice_qty': 1, 'die_faces': faces, 'modifier': modifier, 'finalmod': 0}
+
+
+def record(faces, value, modifier=0):
+    return {'dice_qty': 1, 'die_faces': faces, 'modifier': modifier, 'finalmod': 0, 'values': [value]}
+
+
+SNAPSHOT = {'settings': {'use_random_org': False, 'autosave': True},
+            'Attack'  : {'index'  : 0,
+                         'rollers': {'sword': roller(0, 20, 5), 'dagger': roller(1, 4)},
+                         'history': [{'time': 1700000000 + i, 'rolls': {'0': record(20, 1 + i % 20, 5),
+                                                                        '1': record(4, 1 + i % 4)}}
+                                     for i in range(40)]},
+            'Heal'    : {'index'  : 1,
+                         'rollers': {'potion': roller(0, 8)},
+                         'history': []}}
+
+
+def normalized(events):
+    return GroupHistory.from_list(events).to_list()
+
+
+class ContainerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir  = mkdtemp()
+        self.json = os.path.join(self.dir, 'table.json')
+        self.prly = os.path.join(self.dir, 'table' + container.EXTENSION)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def assertSameTable(self, snapshot):
+        self.assertEqual(snapshot['settings'], SNAPSHOT['settings'])
+        for name in ('Attack', 'Heal'):
+            group = snapshot[name]
+            self.assertEqual(group['index'], SNAPSHOT[name]['index'])
+            self.assertEqual(group['rollers'], SNAPSHOT[name]['rollers'])
+            self.assertEqual(normalized(group['history']), normalized(SNAPSHOT[name]['history']))
+
+    def test_sections_round_trip(self):
+        container.write(self.prly, container.to_container(deepcopy(SNAPSHOT)))
+        self.assertTrue(container.is_container(self.prly))
+
+        snapshot = container.read(self.prly)
+        section  = snapshot['Attack']['history']
+        self.assertIsInstance(section, container.Section)
+        self.assertIsNone(section.data)
+        self.assertEqual((section.events, section.time), (40, 1700000039))
+        self.assertSameTable(container.to_json(snapshot))
+
+    def test_convert_json_to_container_and_back(self):
+        journal.Journal(self.json).write_snapshot(deepcopy(SNAPSHOT))
+        container.convert(self.json, self.prly)
+        os.remove(self.json)
+        container.convert(self.prly, self.json)
+        self.assertSameTable(journal.load(self.json)[0])
+
+    def test_cli_rolls_groups_from_container(self):
+        container.write(self.prly, container.to_container(deepcopy(SNAPSHOT)))
+        rng.seeded.reseed(7)
+        with mock.patch.object(cli, 'stdout', io.StringIO()) as out:
+            self.assertEqual(cli.roll(self.prly, times=2, source=rng.seeded), 0)
+        lines = [loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(line['group'], line['roll']) for line in lines],
+                         [('Attack', 0), ('Heal', 0), ('Attack', 1), ('Heal', 1)])
+        self.assertEqual([r['name'] for r in lines[0]['rollers']], ['sword', 'dagger'])
+        self.assertTrue(all(1 <= r['values'][0] <= 8 for r in lines[1]['rollers']))
+
+
+if __name__ == '__main__':
+    unittest.main()
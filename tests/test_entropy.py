@@ -0,0 +1,103 @@
+import importlib.util
+import os
+import unittest
+from unittest import mock
+
+from polyrolly import entropy
+
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'poly-rolly.py')
+
+
+class FixedSource:
+    def __init__(self, value):
+        self.value = value
+
+    def randint(self, low, high):
+        return self.value
+
+
+class EntropyPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = entropy.EntropyPool(low_water=0)
+        self.pool.fallback = FixedSource(4)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_rejects_values_past_the_limit(self):
+        limit = entropy.rejection_limit(6)
+        self.pool.buffer.extend([limit, entropy.BLOCK_RANGE - 1, 7, 12])
+        self.assertEqual(self.pool.randints(2, 1, 6), [2, 1])
+        self.assertEqual((self.pool.served, self.pool.fallbacks, len(self.pool)), (2, 0, 0))
+
+    def test_empty_pool_falls_back(self):
+        with mock.patch.object(self.pool, 'start') as start:
+            self.assertEqual(self.pool.randint(1, 6), 4)
+        start.assert_called_once_with()
+        self.assertEqual((self.pool.served, self.pool.fallbacks), (0, 1))
+
+    def test_refill_from_fetched_block(self):
+        block = list(range(100))
+        with mock.patch.object(entropy, 'fetch_block', return_value=block) as fetch:
+            self.assertTrue(self.pool.wait_for(100, timeout=5))
+        self.assertEqual(fetch.call_args[0][1:], (self.pool.block_size, 0, entropy.BLOCK_RANGE - 1))
+        self.assertEqual(self.pool.randints(3, 1, 20), [1, 2, 3])
+        self.assertEqual(self.pool.fetches, 1)
+
+    def test_range_wider_than_block_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.pool.randint(0, entropy.BLOCK_RANGE)
+
+
+class StubbedClient(entropy.RandomOrgClient):
+    def __init__(self, *blocks):
+        super().__init__()
+        self.blocks  = list(blocks)
+        self.fetched = []
+
+    def fetch(self, num, low, high):
+        self.fetched.append(num)
+        self.requests += 1
+        if not self.blocks:
+            raise OSError('random.org is unreachable')
+        return self.blocks.pop(0)
+
+
+class RandomOrgClientTest(unittest.TestCase):
+    def test_one_request_per_group(self):
+        client = StubbedClient(list(range(20)))
+        batch  = client.draw_group([(2, 6), (1, 20), (3, 4)])
+        self.assertEqual(batch, [[1, 2], [3], [4, 1, 2]])
+        self.assertEqual(client.fetched, [6 + 4])
+        self.assertEqual((client.group_rolls, client.rollers, client.requests_saved), (1, 3, 2))
+
+    def test_rejected_values_top_up(self):
+        reject = entropy.BLOCK_RANGE - 1
+        client = StubbedClient([reject] * 6, [0, 1])
+        self.assertEqual(client.draw_group([(2, 6)]), [[1, 2]])
+        self.assertEqual(client.fetched, [6, 4])
+
+    def test_failure_propagates(self):
+        client = StubbedClient()
+        with self.assertRaises(OSError):
+            client.draw_group([(1, 6)])
+        self.assertEqual((client.group_rolls, client.rollers), (0, 0))
+
+
+class GroupFallbackTest(unittest.TestCase):
+    def setUp(self):
+        spec = importlib.util.spec_from_file_location('poly_rolly', APP)
+        self.app = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.app)
+
+    def test_unreachable_random_org_uses_csprng(self):
+        with mock.patch.object(self.app, 'random_org', StubbedClient()):
+            batch = self.app.draw_group([(2, 6), (3, 20)])
+        self.assertEqual([len(results) for results in batch], [2, 3])
+        self.assertTrue(all(1 <= value <= 6 for value in batch[0]))
+        self.assertTrue(all(1 <= value <= 20 for value in batch[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from polyrolly.expression import parse
+
+
+class RerollParseTest(unittest.TestCase):
+    def test_bare_reroll_face(self):
+        term, = parse('3d6r1').terms
+        self.assertEqual(term.reroll, (1, 1))
+        self.assertFalse(term.once)
+
+    def test_bare_reroll_once_face(self):
+        term, = parse('4d6ro2').terms
+        self.assertEqual(term.reroll, (2, 2))
+        self.assertTrue(term.once)
+
+    def test_bare_explode_face(self):
+        term, = parse('8d10!9').terms
+        self.assertEqual(term.explode, (9, 9))
+
+    def test_defaults(self):
+        term, = parse('3d6r!').terms
+        self.assertEqual((term.reroll, term.explode), ((1, 1), (6, 6)))
+
+    def test_endless_reroll(self):
+        with self.assertRaises(ValueError):
+            parse('1d1r1')
@@ -0,0 +1,35 @@
+import unittest
+from json import loads
+
+from polyrolly       import journal
+from polyrolly.store import GroupStore, load_group
+
+
+def record(value):
+    return {'dice_qty': 1, 'die_faces': 6, 'modifier': 0, 'finalmod': 0, 'values': [value]}
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.store   = GroupStore(None, {'keep': 10, 'archive': False})
+        self.history = self.store.history
+        self.history.append(1, {0: record(1), 1: record(2)})
+        for i in range(100):
+            self.history.append(2 + i, {0: record(3)})
+
+    def test_idle_roller_survives_pruning(self):
+        history = self.history
+        self.assertGreater(history.events_base, 0)
+        for index in (history.oldest, len(history) - 1):
+            state = history.state_at(index)
+            self.assertEqual(sorted(state), [0, 1])
+            self.assertEqual(state[1]['values'], [2])
+            self.assertEqual(state[1]['results_text'], '2 = 2')
+
+    def test_idle_roller_survives_reload(self):
+        settings = self.store.save({'rollers': {'a': {'index': 0, 'id': 0}, 'b': {'index': 1, 'id': 1}}}, {0, 1})
+        settings = loads(journal.dump_compact(settings))
+        rollers, loaded = load_group('', settings, None)
+        history = loaded.history
+        self.assertEqual(len(history), len(self.history))
+        self.assertEqual(history.state_at(len(history) - 1)[1]['values'], [2])
@@ -0,0 +1,127 @@
+import importlib.util
+import os
+import shutil
+import time
+import tkinter
+import unittest
+from json     import loads
+from tempfile import mkdtemp
+
+from polyrolly import journal
+
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'poly-rolly.py')
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('poly_rolly', APP)
+    app  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+class GroupRollJournalTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.root = tkinter.Tk()
+        except tkinter.TclError as e:
+            self.skipTest('Tk is unavailable: {}'.format(e))
+        self.app  = load_app()
+        self.main = self.app.MainFrame(self.root)
+        self.dir  = mkdtemp()
+
+    def tearDown(self):
+        self.main.saver.flush()
+        self.root.destroy()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def wait_for_roll(self):
+        deadline = time.time() + 10
+        while self.main.rolling:
+            self.assertLess(time.time(), deadline, 'roll did not finish')
+            self.root.update()
+            time.sleep(.01)
+
+    def test_group_roll_appends_one_line(self):
+        group = self.app.roller_groups[0]
+        while len(group.rollers) < 10:
+            group.rollers[-1].add_roller()
+        fpath = os.path.join(self.dir, 'table.json')
+        self.main.autosave.set(True)
+        self.main.save_config(fpath)
+        self.main.saver.flush()
+
+        for i in range(3):
+            group.roll_group()
+            self.wait_for_roll()
+            self.main.saver.flush()
+            with open(fpath + '.log') as f:
+                ops = [loads(line)['op'] for line in f]
+            self.assertEqual(ops, ['snapshot'] + ['roll'] * (i + 1))
+
+
+def roll_event(value):
+    record = {'dice_qty': 1, 'die_faces': 6, 'modifier': 0, 'finalmod': 0, 'values': [value]}
+    return {'op': 'roll', 'g': 0, 'event': {'time': 1700000000 + value, 'rolls': {'0': record}}}
+
+
+class CompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir   = mkdtemp()
+        self.fpath = os.path.join(self.dir, 'table.json')
+        self.log   = journal.Journal(self.fpath)
+        self.log.write_snapshot({'G': {'index': 0, 'rollers': {'a': {'index': 0, 'id': 0}}}})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_replay(self):
+        self.log.append([roll_event(3), roll_event(5), {'op': 'roller', 'g': 0, 'r': 0, 'k': 'name', 'v': 'b'}])
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 3)
+        group = snapshot['G']
+        self.assertEqual([event['rolls']['0']['values'] for event in group['history']], [[3], [5]])
+        self.assertEqual(list(group['rollers']), ['b'])
+        self.assertEqual(group['rollers']['b']['stats']['count'], 2)
+
+    def test_amend_replays_onto_history(self):
+        self.log.append([roll_event(3), {'op': 'amend', 'g': 0, 'i': 0, 'id': 0, 'v': {'modifier': 2}}])
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 2)
+        self.assertEqual(snapshot['G']['history'][0]['rolls']['0']['modifier'], 2)
+        self.assertEqual(snapshot['G']['history'][0]['rolls']['0']['values'], [3])
+
+    def test_torn_last_line_is_dropped(self):
+        self.log.append([roll_event(3)])
+        with open(self.fpath + '.log', 'a') as f:
+            f.write(journal.dump_compact(roll_event(4))[:20])
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 1)
+        self.assertEqual(len(snapshot['G']['history']), 1)
+
+    def test_compaction_resets_log(self):
+        self.log.append([roll_event(3)])
+        snapshot, events = journal.load(self.fpath)
+        self.log.write_snapshot(snapshot)
+        self.log.append([roll_event(4)])
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 1)
+        self.assertEqual(len(snapshot['G']['history']), 2)
+
+    def test_crash_before_log_reset_skips_compacted_events(self):
+        self.log.append([roll_event(3), roll_event(5)])
+        snapshot, events = journal.load(self.fpath)
+        journal.write_atomic(self.fpath, journal.dump_compact(snapshot))
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 0)
+        self.assertEqual(len(snapshot['G']['history']), 2)
+
+    def test_log_without_mark_is_replayed(self):
+        with open(self.fpath + '.log', 'w') as f:
+            f.write(journal.dump_compact(roll_event(2)) + '\n')
+        snapshot, events = journal.load(self.fpath)
+        self.assertEqual(events, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()